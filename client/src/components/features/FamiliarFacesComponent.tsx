@@ -181,12 +181,8 @@ const FamiliarFacesComponent: React.FC = () => {
 
     for (const face of newFaces) {
       try {
+        // The server stores encodings.dat itself, in its binary format
         const encodings = await fetchEncodingsFromServer([face]);
-        const filename = `${user.uid}/encodings.dat`;
-        const file = new Blob([JSON.stringify(encodings.encodings)], {
-          type: "application/json",
-        });
-        await uploadDatFileToFirebase(file, filename);
 
         if (encodings.errors.includes(face.displayName)) {
           throw new Error(`Face ${face.displayName} was not recognized.`);
@@ -310,11 +306,6 @@ const FamiliarFacesComponent: React.FC = () => {
     }
   };
 
-  const uploadDatFileToFirebase = async (file: Blob, filename: string) => {
-    const fileRef = storageRef(storage, filename);
-    await uploadBytes(fileRef, file);
-    // alert("Encodings file uploaded to Firebase Storage successfully.");
-  };
   const totalPages = Math.ceil((faces.length + newFaces.length) / itemsPerPage);
 
   const currentItems = [
@@ -29,6 +29,7 @@ const VideoComponent: React.FC<VideoComponentProps> = ({
   onGoBack,
 }) => {
   const [videoStream, setVideoStream] = useState<string | null>(null);
+  const [isRecording, setIsRecording] = useState(false);
   const [videoDetails, setVideoDetails] = useState<VideoDetails>({
     location: "",
     timestamp: "",
@@ -61,6 +62,8 @@ const VideoComponent: React.FC<VideoComponentProps> = ({
         throw new Error("Network response was not ok.");
       }
 
+      // Progressive clips are served while the event is still being recorded
+      setIsRecording(response.headers.get("X-Clip-Complete") === "false");
       const blob = await response.blob();
       videoObjectUrl = URL.createObjectURL(blob);
       setVideoStream(videoObjectUrl);
@@ -131,6 +134,9 @@ const VideoComponent: React.FC<VideoComponentProps> = ({
             {convertFirestoreTimestampToDate(videoDetails.timestamp)}
           </p>
         )}
+        {isRecording && (
+          <p>Still recording, reopen the clip to see the rest of the event.</p>
+        )}
         <Divider />
 
         {videoStream ? (
@@ -0,0 +1,88 @@
+"""Compare face detection latency and recall across detection scales.
+
+Usage:
+    python benchDetection.py footage.mp4 [--every 15] [--limit 200]
+
+Detections at native resolution are the reference; recall is the share of
+reference faces that a scale setting finds with IoU >= 0.5.
+"""
+
+import argparse
+import time
+
+import cv2
+import dlib
+
+from faceDetection import detect_faces, iou
+
+CONFIGS = [
+    ("native", 1.0, ()),
+    ("0.75", 0.75, ()),
+    ("0.5", 0.5, ()),
+    ("0.5+0.75", 0.5, (0.75,)),
+    ("0.5+1.0", 0.5, (1.0,)),
+    ("0.35", 0.35, ()),
+]
+
+
+def load_frames(path, every, limit):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    index = 0
+    while len(frames) < limit:
+        success, frame = capture.read()
+        if not success:
+            break
+        if index % every == 0:
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        index += 1
+    capture.release()
+    return frames
+
+
+def recall(reference, found):
+    total = sum(len(faces) for faces in reference)
+    if not total:
+        return float("nan")
+    hits = sum(
+        1
+        for expected, detected in zip(reference, found)
+        for face in expected
+        if any(iou(face, other) >= 0.5 for other in detected)
+    )
+    return hits / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("footage", help="video file recorded by a device")
+    parser.add_argument("--every", type=int, default=15, help="sample every nth frame")
+    parser.add_argument("--limit", type=int, default=200, help="frames to sample")
+    args = parser.parse_args()
+
+    frames = load_frames(args.footage, args.every, args.limit)
+    if not frames:
+        print(f"No frames read from {args.footage}")
+        return
+    height, width = frames[0].shape[:2]
+    print(f"Sampled {len(frames)} frames at {width}x{height}")
+
+    face_detector = dlib.get_frontal_face_detector()
+    reference = None
+    for name, scale, pyramid in CONFIGS:
+        found = []
+        start = time.perf_counter()
+        for frame in frames:
+            found.append(detect_faces(frame, face_detector, scale, pyramid))
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = found
+        faces = sum(len(faces) for faces in found)
+        print(
+            f"{name:<10} {elapsed / len(frames) * 1000:8.1f} ms/frame "
+            f"faces={faces:<5} recall={recall(reference, found):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare time and peak memory per enrollment photo, before and after pre-resizing.
+
+Usage:
+    python benchEnrollment.py photo1.jpg [photo2.jpg ...]
+
+Each photo is encoded in a fresh process per method so peak RSS is measured
+on its own. "full" is the old path (full-resolution load, detection and
+encoding); "resized" uses enrollmentImage. The distance between the two
+descriptors shows the resized path still describes the same face (< 0.6).
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # not available on Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_child(method, path):
+    """Encode one photo with one method, print the result as JSON."""
+    import face_recognition
+
+    from enrollmentImage import encode_enrollment_face, load_enrollment_image
+
+    start_time = time.perf_counter()
+    if method == "full":
+        image = face_recognition.load_image_file(path)
+        encodings = face_recognition.face_encodings(image)
+        encoding = encodings[0] if encodings else None
+    else:
+        encoding = encode_enrollment_face(load_enrollment_image(path))
+    seconds = time.perf_counter() - start_time
+
+    print(
+        json.dumps(
+            {
+                "seconds": seconds,
+                "peak_rss_mb": peak_rss_mb(),
+                "encoding": None if encoding is None else encoding.tolist(),
+            }
+        )
+    )
+
+
+def measure(method, path):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", method, path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", nargs="+")
+    args = parser.parse_args()
+
+    print(f"{'photo':<30} {'method':<8} {'seconds':>8} {'peak MB':>8} {'distance':>9}")
+    for path in args.photos:
+        results = {method: measure(method, path) for method in ("full", "resized")}
+        full, resized = results["full"]["encoding"], results["resized"]["encoding"]
+        distance = None
+        if full is not None and resized is not None:
+            distance = sum((a - b) ** 2 for a, b in zip(full, resized)) ** 0.5
+        for method, result in results.items():
+            print(
+                f"{path[-30:]:<30} {method:<8} {result['seconds']:>8.2f} "
+                f"{str(result['peak_rss_mb']):>8} "
+                f"{'' if method == 'full' or distance is None else f'{distance:.3f}':>9}"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3])
+    else:
+        main()
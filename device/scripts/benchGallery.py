@@ -0,0 +1,80 @@
+"""Compare exact and clustered (IVF) gallery search at several gallery sizes.
+
+Usage:
+    python benchGallery.py [--sizes 100 1000 10000] [--samples 3] [--queries 500]
+
+Galleries are synthetic: each identity is a random centre with a few noisy
+samples around it, and queries are new noisy views of enrolled identities.
+Recall is the share of queries for which the IVF search returns the same
+best identity as the exact search.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from faceGallery import FACE_ENCODING_SIZE, FaceGallery
+from galleryFormat import Gallery
+
+FACES_PER_FRAME = 4  # queries are matched in frame-sized batches
+IDENTITY_SPREAD = 0.06  # scale of the distance between identities
+SAMPLE_NOISE = 0.03  # scale of the variation between photos of one identity
+
+
+def synthetic_gallery(identities, samples, rng):
+    centres = rng.normal(size=(identities, FACE_ENCODING_SIZE)) * IDENTITY_SPREAD
+    rows = np.repeat(centres, samples, axis=0)
+    rows += rng.normal(size=rows.shape) * SAMPLE_NOISE
+    names = [f"person{i}" for i in range(identities) for _ in range(samples)]
+    return Gallery(names, rows.astype(np.float32), None), centres
+
+
+def time_queries(gallery, queries):
+    start_time = time.perf_counter()
+    results = []
+    for first in range(0, len(queries), FACES_PER_FRAME):
+        results.extend(gallery.match(queries[first : first + FACES_PER_FRAME]))
+    elapsed = time.perf_counter() - start_time
+    per_frame = elapsed / -(-len(queries) // FACES_PER_FRAME)
+    return results, per_frame * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--probes", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'identities':>10} {'samples':>8} {'build ms':>9} {'exact ms':>9} "
+        f"{'ivf ms':>8} {'recall':>7}"
+    )
+    for identities in args.sizes:
+        rows, centres = synthetic_gallery(identities, args.samples, rng)
+        picked = rng.integers(0, identities, args.queries)
+        noise = rng.normal(size=(args.queries, FACE_ENCODING_SIZE)) * SAMPLE_NOISE
+        queries = (centres[picked] + noise).astype(np.float32)
+
+        exact = FaceGallery(rows, ivf_min_samples=float("inf"))
+        start_time = time.perf_counter()
+        # Force the clustered index even for small galleries to compare both
+        clustered = FaceGallery(rows, ivf_min_samples=0, probes=args.probes)
+        build_ms = (time.perf_counter() - start_time) * 1000
+
+        exact_results, exact_ms = time_queries(exact, queries)
+        ivf_results, ivf_ms = time_queries(clustered, queries)
+        recall = np.mean(
+            [a[0][0] == b[0][0] for a, b in zip(exact_results, ivf_results)]
+        )
+        print(
+            f"{identities:>10} {len(rows.names):>8} {build_ms:>9.1f} "
+            f"{exact_ms:>9.3f} {ivf_ms:>8.3f} {recall:>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Micro-benchmark for the MJPEG demuxer used by frame_capture_thread.
+
+Usage:
+    python benchMjpeg.py --record http://localhost:5000/video_feed?token=... stream.mjpeg
+    python benchMjpeg.py stream.mjpeg
+    python benchMjpeg.py  # synthetic 720p-sized stream
+"""
+
+import argparse
+import os
+import time
+
+from mjpegDemuxer import EOI, SOI, MjpegDemuxer
+
+
+def record_stream(url, path, seconds=10):
+    """Save the raw multipart bytes of a live stream to a file."""
+    import requests
+
+    deadline = time.time() + seconds
+    with requests.get(url, stream=True) as r, open(path, "wb") as file:
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            file.write(chunk)
+            if time.time() >= deadline:
+                break
+    print(f"Recorded {os.path.getsize(path)} bytes to {path}")
+
+
+def synthetic_stream(frames=300, frame_size=120 * 1024, content_length=True):
+    """Build a stream shaped like DeviceStream.gen_frames output."""
+    body = SOI + os.urandom(frame_size - 4).replace(b"\xff", b"\x00") + EOI
+    if content_length:
+        part = (
+            b"--frame\r\nContent-Type: image/jpeg\r\n"
+            + b"Content-Length: %d\r\n\r\n" % len(body)
+            + body
+            + b"\r\n"
+        )
+    else:
+        part = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + body + b"\r\n"
+    return part * frames
+
+
+def chunked(data, chunk_size):
+    view = memoryview(data)
+    for i in range(0, len(data), chunk_size):
+        yield view[i : i + chunk_size]
+
+
+def legacy_parse(data, chunk_size):
+    """The original bytes-concatenation parser from frame_capture_thread."""
+    frames = 0
+    bytes_buffer = bytes()
+    for chunk in chunked(data, chunk_size):
+        bytes_buffer += chunk
+        a = bytes_buffer.find(b"\xff\xd8")
+        b = bytes_buffer.find(b"\xff\xd9")
+        if a != -1 and b != -1:
+            jpg = bytes_buffer[a : b + 2]
+            bytes_buffer = bytes_buffer[b + 2 :]
+            frames += 1
+    return frames
+
+
+def demuxer_parse(data, chunk_size):
+    demuxer = MjpegDemuxer()
+    frames = 0
+    for chunk in chunked(data, chunk_size):
+        for jpg in demuxer.feed(chunk):
+            frames += 1
+    return frames
+
+
+def run(name, parser, data, chunk_size, repeat):
+    best = None
+    frames = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = parser(data, chunk_size)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    mb_per_s = len(data) / best / (1024 * 1024)
+    print(
+        f"{name:<10} chunk={chunk_size:<6} frames={frames:<5} "
+        f"{mb_per_s:8.1f} MB/s {frames / best:9.1f} frames/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("stream", nargs="?", help="recorded multipart stream")
+    parser.add_argument("--record", metavar="URL", help="record URL into stream")
+    parser.add_argument("--seconds", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true", help="also time old parser")
+    args = parser.parse_args()
+
+    if args.record:
+        record_stream(args.record, args.stream or "stream.mjpeg", args.seconds)
+        return
+
+    if args.stream:
+        with open(args.stream, "rb") as file:
+            data = file.read()
+    else:
+        data = synthetic_stream()
+    print(f"Stream size: {len(data) / (1024 * 1024):.1f} MB")
+
+    for chunk_size in (1024, 16 * 1024, 64 * 1024):
+        run("demuxer", demuxer_parse, data, chunk_size, args.repeat)
+        if args.legacy:
+            run("legacy", legacy_parse, data, chunk_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
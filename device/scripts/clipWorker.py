@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+
+
+class ClipJob:
+    """Everything needed to finalize one event clip away from the capture thread."""
+
+    def __init__(self, event_id, frames, face_frame, fps, segment_range=None):
+        self.event_id = event_id
+        self.frames = frames
+        self.face_frame = face_frame
+        self.fps = fps
+        # (start, end) timestamps when the clip is cut from recorded segments
+        self.segment_range = segment_range
+        self.created = time.time()
+
+
+class ClipWorker:
+    """Background thread that finalizes clips handed over through a bounded queue.
+
+    submit() never blocks: when the queue is full the job is dropped and
+    counted, so the capture loop keeps receiving live frames.
+    """
+
+    def __init__(self, handler, max_pending=2):
+        self.handler = handler
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.jobs_dropped = 0
+        self.frames_dropped = 0
+        self.last_job_seconds = None
+        self.last_wait_seconds = None
+
+    def submit(self, job):
+        """Queue a job without blocking; returns False if it had to be dropped."""
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.jobs_dropped += 1
+                self.frames_dropped += len(job.frames)
+            print(f"Clip queue full, dropped clip {job.event_id}")
+            return False
+
+    def count_dropped_frames(self, count):
+        """Record live frames lost before they reached the buffer."""
+        with self._lock:
+            self.frames_dropped += count
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=60)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "jobs_done": self.jobs_done,
+                "jobs_failed": self.jobs_failed,
+                "jobs_dropped": self.jobs_dropped,
+                "frames_dropped": self.frames_dropped,
+                "last_job_seconds": self.last_job_seconds,
+                "last_wait_seconds": self.last_wait_seconds,
+            }
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            start_time = time.time()
+            try:
+                self.handler(job)
+                succeeded = True
+            except Exception as e:
+                print(f"Error finalizing clip {job.event_id}: {e}")
+                succeeded = False
+            with self._lock:
+                if succeeded:
+                    self.jobs_done += 1
+                else:
+                    self.jobs_failed += 1
+                self.last_wait_seconds = round(start_time - job.created, 2)
+                self.last_job_seconds = round(time.time() - start_time, 2)
@@ -0,0 +1,133 @@
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+FFMPEG_BINARY = "../ffmpeg"
+CLIP_BITRATE = "1860k"
+
+
+class ClipStats:
+    def __init__(self, path, frames, encode_seconds, bytes_written):
+        self.path = path
+        self.frames = frames
+        self.encode_seconds = encode_seconds
+        self.bytes_written = bytes_written
+
+    def __str__(self):
+        return (
+            f"{self.frames} frames encoded in {self.encode_seconds:.2f}s, "
+            f"{self.bytes_written / 1024:.0f} KB written to {self.path}"
+        )
+
+
+class StderrTail:
+    """Read a process's stderr on a thread, keeping only its last lines.
+
+    Draining the pipe while frames are still being written keeps a chatty
+    ffmpeg (e.g. one warning per corrupt JPEG) from filling it and blocking.
+    """
+
+    def __init__(self, stream, lines=20):
+        self._lines = deque(maxlen=lines)
+        self._thread = threading.Thread(target=self._read, args=(stream,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read(self, stream):
+        for line in iter(stream.readline, b""):
+            self._lines.append(line.decode(errors="replace").rstrip())
+        stream.close()
+
+    def text(self, timeout=5):
+        """Return the collected lines once the process closed its stderr."""
+        self._thread.join(timeout)
+        return "\n".join(self._lines)
+
+
+def input_args(first_frame, fps):
+    """ffmpeg input options for raw BGR frames or the original JPEG bytes."""
+    if isinstance(first_frame, (bytes, bytearray, memoryview)):
+        return ["-f", "mjpeg", "-framerate", str(fps), "-i", "-"]
+    height, width = first_frame.shape[:2]
+    return [
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgr24",
+        "-s",
+        f"{width}x{height}",
+        "-framerate",
+        str(fps),
+        "-i",
+        "-",
+    ]
+
+
+def output_args(bitrate):
+    """H.264 output capped at bitrate, ready for progressive playback."""
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-pix_fmt",
+        "yuv420p",
+        "-b:v",
+        bitrate,
+        "-maxrate",
+        bitrate,
+        "-bufsize",
+        bitrate,
+    ]
+
+
+def frame_bytes(frame):
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        return frame
+    return np.ascontiguousarray(frame).data
+
+
+def write_clip(frames, path, fps, bitrate=CLIP_BITRATE):
+    """Encode frames into the final MP4 in one pass through ffmpeg's stdin.
+
+    frames may be decoded BGR frames or JPEG bytes; JPEGs are passed through
+    without being decoded in Python. Returns ClipStats, or None on failure.
+    """
+    if not frames:
+        return None
+
+    start_time = time.time()
+    tmp_path = path + ".tmp.mp4"
+    command = (
+        [FFMPEG_BINARY, "-y", "-loglevel", "error"]
+        + input_args(frames[0], fps)
+        + output_args(bitrate)
+        + ["-movflags", "+faststart", tmp_path]
+    )
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    error = StderrTail(process.stderr)
+    try:
+        for frame in frames:
+            process.stdin.write(frame_bytes(frame))
+        process.stdin.close()
+    except BrokenPipeError:
+        pass  # ffmpeg exited early, its error output explains why
+    process.wait()
+
+    if process.returncode != 0:
+        print(f"ffmpeg failed for {path}: {error.text()}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    os.replace(tmp_path, path)
+    return ClipStats(path, len(frames), time.time() - start_time, os.path.getsize(path))
@@ -0,0 +1,89 @@
+import math
+import threading
+import time
+
+
+class DetectionScheduler:
+    """Hand the newest frame to the detector, never the same frame twice.
+
+    The capture side numbers frames with submit() and the detector blocks in
+    next_frame() until a frame at least `stride` frames newer than the last
+    one it took is available. The stride adapts to the measured detector
+    latency so detection keeps pace with live capture instead of lagging.
+    """
+
+    def __init__(self, fps, min_stride=1, max_stride=None, smoothing=0.2):
+        self.fps = fps
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max_stride or int(fps * 2)
+        self.smoothing = smoothing
+        self.stride = self.min_stride
+
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._item = None
+        self._last_taken = 0
+        self._closed = False
+
+        self.latency = None  # smoothed seconds per detection
+        self.frames_taken = 0
+        self.frames_skipped = 0
+        self.detections = 0  # frames that actually went through the detector
+        self._started = time.time()
+
+    def submit(self, item):
+        """Number a new frame and wake the detector if it is due."""
+        with self._condition:
+            self._sequence += 1
+            self._item = item
+            if self._sequence - self._last_taken >= self.stride:
+                self._condition.notify()
+            return self._sequence
+
+    def next_frame(self, timeout=None):
+        """Return (sequence, item) for the newest due frame, or (None, None)."""
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: self._closed
+                or self._sequence - self._last_taken >= self.stride,
+                timeout,
+            )
+            if not ready or self._closed:
+                return None, None
+            if self._last_taken:
+                self.frames_skipped += self._sequence - self._last_taken - 1
+            self._last_taken = self._sequence
+            self.frames_taken += 1
+            return self._sequence, self._item
+
+    def record_latency(self, seconds):
+        """Feed back how long a detection took and adjust the stride.
+
+        Called once per detection that ran; frames taken but then discarded
+        (an event is recording, the motion gate skipped them) are not counted.
+        """
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.smoothing * (seconds - self.latency)
+        # Frames that arrive while one detection runs
+        stride = math.ceil(self.latency * self.fps)
+        with self._condition:
+            self.detections += 1
+            self.stride = min(self.max_stride, max(self.min_stride, stride))
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        elapsed = max(time.time() - self._started, 1e-6)
+        return {
+            "stride": self.stride,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency else None,
+            "detections_per_second": round(self.detections / elapsed, 2),
+            "detections": self.detections,
+            "frames_taken": self.frames_taken,
+            "frames_skipped": self.frames_skipped,
+        }
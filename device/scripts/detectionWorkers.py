@@ -0,0 +1,296 @@
+import heapq
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+WORKER_CHECK_INTERVAL = 1.0  # seconds between liveness checks of the workers
+
+
+def _worker_main(
+    worker,
+    slot_names,
+    shape,
+    tasks,
+    results,
+    shape_predictor_file,
+    recognition_model_file,
+    detection_scale,
+    detection_pyramid,
+):
+    """Detection process: loads its own dlib models and serves frames from slots."""
+    import dlib
+
+    from faceDetection import detect_faces
+
+    face_detector = dlib.get_frontal_face_detector()
+    shape_predictor = dlib.shape_predictor(shape_predictor_file)
+    face_recognition_model = dlib.face_recognition_model_v1(recognition_model_file)
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    frames = [np.ndarray(shape, dtype=np.uint8, buffer=slot.buf) for slot in slots]
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            source, sequence, slot = task
+            start_time = time.time()
+            rgb_frame = cv2.cvtColor(frames[slot], cv2.COLOR_BGR2RGB)
+            # The slot can be reused as soon as the RGB copy exists
+            results.put(("free", (worker, source, sequence, slot)))
+
+            detections = detect_faces(
+                rgb_frame,
+                face_detector,
+                scale=detection_scale,
+                pyramid=detection_pyramid,
+            )
+            boxes = []
+            descriptors = []
+            for detection in detections:
+                shape = shape_predictor(rgb_frame, detection)
+                descriptors.append(
+                    face_recognition_model.compute_face_descriptor(rgb_frame, shape)
+                )
+                boxes.append(
+                    (
+                        detection.left(),
+                        detection.top(),
+                        detection.right(),
+                        detection.bottom(),
+                    )
+                )
+            results.put(
+                (
+                    "done",
+                    (
+                        worker,
+                        source,
+                        sequence,
+                        boxes,
+                        np.array(descriptors, dtype=np.float32).reshape(-1, 128),
+                        time.time() - start_time,
+                    ),
+                )
+            )
+    finally:
+        del frames
+        for slot in slots:
+            slot.close()
+
+
+class DetectionResult:
+    def __init__(self, source, sequence, boxes, descriptors, latency):
+        self.source = source
+        self.sequence = sequence
+        self.boxes = boxes  # (left, top, right, bottom) per face
+        self.descriptors = descriptors  # float32 (faces x 128)
+        self.latency = latency  # seconds spent in the worker
+
+
+class DetectionWorkerPool:
+    """Run face detection in separate processes with shared-memory frames.
+
+    Frames are copied into preallocated shared-memory slots instead of being
+    pickled, each worker keeps its own dlib models, and results are handed
+    back in submission order per source (camera).
+
+    Workers are started with the spawn method, since the device forks from a
+    process that already runs gRPC, Flask and capture threads. Each worker has
+    its own task queue, so when one dies its frames are known: their slots
+    are freed, their sequence numbers are dropped and the worker is replaced.
+    """
+
+    def __init__(
+        self,
+        workers,
+        frame_shape,
+        shape_predictor_file,
+        recognition_model_file,
+        slots_per_worker=2,
+        detection_scale=1.0,
+        detection_pyramid=(),
+    ):
+        self.frame_shape = tuple(frame_shape)
+        size = int(np.prod(self.frame_shape))
+        self._slots = [
+            shared_memory.SharedMemory(create=True, size=size)
+            for _ in range(workers * slots_per_worker)
+        ]
+        self._frames = [
+            np.ndarray(self.frame_shape, dtype=np.uint8, buffer=slot.buf)
+            for slot in self._slots
+        ]
+        self._free_slots = queue.Queue()
+        for index in range(len(self._slots)):
+            self._free_slots.put(index)
+
+        self._context = mp.get_context("spawn")
+        self._worker_args = (
+            [slot.name for slot in self._slots],
+            self.frame_shape,
+        )
+        self._model_files = (shape_predictor_file, recognition_model_file)
+        self._detection_args = (detection_scale, tuple(detection_pyramid))
+        self._results = self._context.Queue()
+        self._condition = threading.Condition()
+        self._pending = {}  # source -> heap of submitted sequence numbers
+        self._done = {}  # (source, sequence) -> DetectionResult
+        self._processes = [None] * workers
+        self._task_queues = [None] * workers
+        # worker -> {(source, sequence): slot, or None once the worker freed it}
+        self._assigned = [None] * workers
+        self._closed = False
+        for index in range(workers):
+            self._start_worker(index)
+        self._collector = threading.Thread(target=self._collect)
+        self._collector.daemon = True
+        self._collector.start()
+
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0  # lost with a worker that died
+        self.restarts = 0
+
+    def _start_worker(self, index):
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index,
+                *self._worker_args,
+                tasks,
+                self._results,
+                *self._model_files,
+                *self._detection_args,
+            ),
+            daemon=True,
+        )
+        process.start()
+        self._task_queues[index] = tasks
+        self._processes[index] = process
+        self._assigned[index] = {}
+
+    @property
+    def workers(self):
+        return len(self._processes)
+
+    def submit(self, frame, sequence, source=0, timeout=None):
+        """Copy frame into a free slot and queue it; False if none became free."""
+        if frame.shape != self.frame_shape:
+            raise ValueError(
+                f"Frame {frame.shape} does not fit pool {self.frame_shape}"
+            )
+        try:
+            slot = self._free_slots.get(timeout=timeout)
+        except queue.Empty:
+            self.frames_dropped += 1
+            return False
+        np.copyto(self._frames[slot], frame)
+        with self._condition:
+            # The least busy worker; queued under the lock so a restart
+            # cannot swap its queue in between
+            worker = min(range(self.workers), key=lambda i: len(self._assigned[i]))
+            self._assigned[worker][(source, sequence)] = slot
+            heapq.heappush(self._pending.setdefault(source, []), sequence)
+            self._task_queues[worker].put((source, sequence, slot))
+        self.frames_submitted += 1
+        return True
+
+    def results(self, source=0, timeout=None):
+        """Return finished results for source in sequence order."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._ready(source), timeout)
+            ready = []
+            pending = self._pending.get(source, [])
+            while pending and (source, pending[0]) in self._done:
+                ready.append(self._done.pop((source, heapq.heappop(pending))))
+            return ready
+
+    def in_flight(self, source=0):
+        with self._condition:
+            return len(self._pending.get(source, []))
+
+    def _ready(self, source):
+        pending = self._pending.get(source)
+        return bool(pending) and (source, pending[0]) in self._done
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            try:
+                self._handle(*self._results.get(timeout=WORKER_CHECK_INTERVAL))
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            if time.monotonic() - last_check >= WORKER_CHECK_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+
+    def _handle(self, kind, payload):
+        worker, source, sequence = payload[:3]
+        with self._condition:
+            assigned = self._assigned[worker]
+            # Messages from a worker that was already replaced are stale
+            if (source, sequence) not in assigned:
+                return
+            if kind == "free":
+                assigned[(source, sequence)] = None
+                self._free_slots.put(payload[3])
+                return
+            del assigned[(source, sequence)]
+            self._done[(source, sequence)] = DetectionResult(*payload[1:])
+            self._condition.notify_all()
+
+    def _check_workers(self):
+        dead = [
+            i for i, process in enumerate(self._processes) if not process.is_alive()
+        ]
+        if not dead or self._closed:
+            return
+        # Take in what the dead workers sent before they exited
+        while True:
+            try:
+                self._handle(*self._results.get_nowait())
+            except queue.Empty:
+                break
+        with self._condition:
+            for index in dead:
+                assigned = self._assigned[index]
+                print(
+                    f"Detection worker {index} exited with code "
+                    f"{self._processes[index].exitcode}, dropping "
+                    f"{len(assigned)} frames and restarting it"
+                )
+                for (source, sequence), slot in assigned.items():
+                    if slot is not None:
+                        self._free_slots.put(slot)
+                    pending = self._pending.get(source, [])
+                    if sequence in pending:
+                        pending.remove(sequence)
+                        heapq.heapify(pending)
+                self.frames_failed += len(assigned)
+                self.restarts += 1
+                self._start_worker(index)
+            # Results queued behind a dropped sequence are ready now
+            self._condition.notify_all()
+
+    def close(self):
+        self._closed = True
+        for tasks in self._task_queues:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        del self._frames
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
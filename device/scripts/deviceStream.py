@@ -8,6 +8,8 @@ from firebase_admin import credentials, firestore, auth
 import time
 from flask_cors import CORS
 import hashlib
+from frameBus import FrameBus
+from streamHub import JpegBroadcastHub
 
 
 class DeviceStream:
@@ -28,6 +30,9 @@ class DeviceStream:
 
         self.camera = self.init_camera()
         self.camera_lock = threading.Lock()
+        self.frame_bus = self.init_frame_bus()
+        self.stream_hub = JpegBroadcastHub(self.frame_bus)
+        self.capture_thread = None
         self.HASH = self.hash_device_id(self.DEVICE_ID)
         self.PORT = self.get_port_from_hash(int(self.HASH, 16))
 
@@ -75,6 +80,34 @@ class DeviceStream:
             exit(0)
         return camera
 
+    def init_frame_bus(self):
+        # Size the ring from a real frame so every slot is allocated up front
+        success, frame = self.camera.read()
+        if not success:
+            print("Error: Could not read from camera")
+            exit(0)
+        frame = self.resize_frame(frame)
+        frame_bus = FrameBus(frame.shape, frame.dtype)
+        frame_bus.publish(frame)
+        return frame_bus
+
+    def start_capture(self):
+        """Start the single capture producer that feeds the frame bus."""
+        if self.capture_thread is None or not self.capture_thread.is_alive():
+            self.capture_thread = threading.Thread(target=self.capture_frames)
+            self.capture_thread.daemon = True
+            self.capture_thread.start()
+
+    def capture_frames(self):
+        while True:
+            with self.camera_lock:
+                success, frame = self.camera.read()
+            if not success:
+                print("Error: Camera stopped delivering frames")
+                self.frame_bus.close()
+                break
+            self.frame_bus.publish(self.resize_frame(frame))
+
     def hash_device_id(self, device_id):
         return hashlib.md5(device_id.encode()).hexdigest()
 
@@ -93,16 +126,8 @@ class DeviceStream:
             return None
 
     def gen_frames(self):
-        while True:
-            with self.camera_lock:
-                success, frame = self.camera.read()
-            if not success:
-                break
-
-            frame = self.resize_frame(frame)  # Resize outside of lock
-            ret, buffer = cv2.imencode(".jpg", frame)
-            frame = buffer.tobytes()
-            yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+        # Frames are captured and encoded once, then shared by all viewers
+        return self.stream_hub.frames()
 
     def resize_frame(self, frame):
         height, width = frame.shape[:2]
@@ -149,6 +174,7 @@ class DeviceStream:
             print(f"Error registering device: {e}")
 
     def run_server(self, in_background=False):
+        self.start_capture()
         if in_background:
             flask_thread = threading.Thread(
                 target=lambda: self.app.run(
@@ -1,47 +1,73 @@
-import face_recognition
-import pickle
 import os
-import numpy as np
+from galleryFormat import (
+    gallery_to_samples,
+    read_gallery,
+    samples_to_rows,
+    write_gallery,
+)
+from enrollmentImage import (
+    DUPLICATE_THRESHOLD,
+    encode_enrollment_face,
+    find_duplicates,
+    load_enrollment_image,
+)
 
 
 def save_encodings(encodings, filename="encodings.dat"):
-    """Save face encodings to a file."""
-    with open(filename, "wb") as file:
-        pickle.dump(encodings, file)
+    """Save {name: [encoding, ...]} in the shared binary gallery format."""
+    write_gallery(filename, *samples_to_rows(encodings))
 
 
 def load_encodings(filename="encodings.dat"):
-    """Load face encodings from a file."""
+    """Load {name: [encoding, ...]}, including files from older versions."""
     if os.path.exists(filename):
-        with open(filename, "rb") as file:
-            return pickle.load(file)
+        # This file was written locally, so older pickled files are trusted
+        gallery = read_gallery(filename, mmap=False, allow_pickle=True)
+        return gallery_to_samples(gallery)
     return {}
 
 
-def add_face(known_faces):
-    """Add a new face to the known faces."""
+def add_face(known_faces, threshold=DUPLICATE_THRESHOLD):
+    """Add faces; a name may map to one image path or a list of them.
+
+    Every photo of a person becomes one more sample of that identity. A
+    photo that looks like another identity (distance below threshold), or
+    repeats a sample the identity already has, is skipped.
+    """
     encodings = load_encodings()
-    for name, image_path in known_faces.items():
-        image = face_recognition.load_image_file(image_path)
-        # Ensure at least one face is found
-        if len(face_recognition.face_encodings(image)) > 0:
-            encoding = face_recognition.face_encodings(image)[0]
-            if name in encodings or any(
-                np.array_equal(encoding, existing_encoding)
-                for existing_encoding in encodings.values()
-            ):
-                print(f"Face {name} already exists. Skipping.")
+    names, image_paths, new_encodings = [], [], []
+    for name, paths in known_faces.items():
+        if isinstance(paths, str):
+            paths = [paths]
+        for image_path in paths:
+            # Reduced-resolution decode, detection on a small copy, descriptor on a crop
+            encoding = encode_enrollment_face(load_enrollment_image(image_path))
+            # Ensure at least one face is found
+            if encoding is None:
+                print(f"No faces found in {image_path}. Skipping.")
                 continue
-            encodings[name] = encoding
-        else:
-            print(f"No faces found in {image_path}. Skipping.")
+            names.append(name)
+            image_paths.append(image_path)
+            new_encodings.append(encoding)
+
+    duplicates = find_duplicates(encodings, names, new_encodings, threshold)
+    for name, image_path, encoding, duplicate in zip(
+        names, image_paths, new_encodings, duplicates
+    ):
+        if duplicate == name:
+            print(f"Face in {image_path} is already a sample of {name}. Skipping.")
+            continue
+        if duplicate is not None:
+            print(f"Face in {image_path} looks like {duplicate}. Skipping.")
+            continue
+        encodings.setdefault(name, []).append(encoding)
     return encodings
 
 
 def remove_face(name):
-    """Remove a face from the known faces."""
+    """Remove a face and all of its samples from the known faces."""
     encodings = load_encodings()
-    print(encodings)
+    print(list(encodings))
     if name in encodings:
         del encodings[name]
         print(f"Face {name} removed.")
@@ -53,8 +79,9 @@ def remove_face(name):
 # Define the known faces and images
 known_faces = {
     "Unknown": "my_image.jpg",
-    # Add more people and their image paths here
-    # "Person2": "path_to_person2_image.jpg",
+    # Add more people and their image paths here, several photos per person
+    # improve recognition
+    # "Person2": ["person2_front.jpg", "person2_side.jpg"],
 }
 # encodings = remove_face("Daniel")
 encodings = add_face(known_faces)
@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+
+from galleryFormat import GalleryFormatError, read_gallery
+
+
+class EncodingsSync:
+    """Keep the local encodings.dat in sync with Storage and hot-swap it in.
+
+    Each check fetches only the blob's metadata; the file is downloaded when
+    its generation differs from the one recorded next to the local copy. The
+    download goes to a temporary file that replaces the local one atomically,
+    then on_update(gallery) is called, e.g. FaceGallery.rebuild, which swaps
+    the new index in without pausing detection. notify() forces an immediate
+    check, for example when Firestore signals that the gallery changed.
+    """
+
+    def __init__(self, bucket, blob_name, local_path, interval=1800, on_update=None):
+        self.bucket = bucket
+        self.blob_name = blob_name
+        self.local_path = local_path
+        self.state_path = local_path + ".meta"
+        self.interval = interval
+        self.on_update = on_update
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.checks = 0
+        self.downloads = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def notify(self):
+        """Check for a new version now instead of at the next interval."""
+        self._wake.set()
+
+    def sync(self):
+        """Download the gallery if it changed; returns True when it did."""
+        with self._lock:
+            self.checks += 1
+            blob = self.bucket.get_blob(self.blob_name)  # metadata only
+            if blob is None:
+                print("Encodings file not found in Firebase Storage.")
+                return False
+
+            state = self._read_state()
+            if (
+                os.path.exists(self.local_path)
+                and state.get("generation") == blob.generation
+                and state.get("md5") == blob.md5_hash
+            ):
+                return False
+
+            tmp_path = self.local_path + ".download"
+            # Pin the generation so a concurrent upload cannot be half-read;
+            # the client library verifies the MD5 of what it downloaded
+            blob.download_to_filename(tmp_path, if_generation_match=blob.generation)
+            try:
+                read_gallery(tmp_path, mmap=False, verify=True)
+            except (OSError, GalleryFormatError) as e:
+                print(f"Downloaded encodings file is invalid: {e}")
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, self.local_path)
+            self._write_state({"generation": blob.generation, "md5": blob.md5_hash})
+            self.downloads += 1
+            print(f"Encodings file updated to generation {blob.generation}.")
+            return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                if self.sync() and self.on_update is not None:
+                    self.on_update(read_gallery(self.local_path, mmap=False))
+            except Exception as e:
+                print(f"Error syncing encodings: {e}")
+
+    def _read_state(self):
+        try:
+            with open(self.state_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.state_path)
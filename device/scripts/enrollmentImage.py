@@ -0,0 +1,137 @@
+import face_recognition
+import numpy as np
+from PIL import Image, ImageOps
+
+from galleryFormat import DIMENSION, samples_to_rows
+
+MAX_DECODE_SIZE = 2048  # long side kept when decoding, enough for a sharp face crop
+MAX_DETECTION_SIZE = 1024  # long side of the copy the HOG detector runs on
+CROP_MARGIN = 0.5  # context kept around the face box, relative to its size
+MAX_FACE_SIZE = 300  # face width in the crop, the descriptor uses a 150px chip
+DUPLICATE_THRESHOLD = 0.45  # closer than this to another identity, same person
+SAMPLE_THRESHOLD = 0.1  # closer than this to its own identity, nothing new
+
+
+def load_enrollment_image(source):
+    """Open a photo at reduced resolution, upright according to its EXIF tag.
+
+    source is a path or a file object. JPEGs are decoded directly at a
+    1/2, 1/4 or 1/8 scale when the photo is much larger than MAX_DECODE_SIZE,
+    which avoids ever holding the full 12-48 MP image in memory.
+    """
+    image = Image.open(source)
+    image.draft("RGB", (MAX_DECODE_SIZE, MAX_DECODE_SIZE))
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > MAX_DECODE_SIZE:
+        image.thumbnail((MAX_DECODE_SIZE, MAX_DECODE_SIZE), Image.BILINEAR)
+    return image.convert("RGB")
+
+
+def _largest(locations):
+    return max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+
+
+def encode_enrollment_face(image):
+    """Return the descriptor of the largest face in a PIL image, or None.
+
+    Detection runs on a copy bounded by MAX_DETECTION_SIZE; landmarks and the
+    descriptor are computed on a crop around the face from the larger image.
+    """
+    width, height = image.size
+    scale = min(1.0, MAX_DETECTION_SIZE / max(width, height))
+    small = image
+    if scale < 1.0:
+        small = image.resize(
+            (round(width * scale), round(height * scale)), Image.BILINEAR
+        )
+    locations = face_recognition.face_locations(np.asarray(small))
+    if not locations and scale < 1.0:
+        # A small face in a large photo, look closer before giving up
+        locations = face_recognition.face_locations(
+            np.asarray(small), number_of_times_to_upsample=2
+        )
+    if not locations:
+        return None
+
+    # (top, right, bottom, left) back in full image coordinates
+    top, right, bottom, left = (int(round(v / scale)) for v in _largest(locations))
+    margin = int(CROP_MARGIN * max(bottom - top, right - left))
+    crop_left, crop_top = max(0, left - margin), max(0, top - margin)
+    crop_right, crop_bottom = min(width, right + margin), min(height, bottom + margin)
+    crop = image.crop((crop_left, crop_top, crop_right, crop_bottom))
+    box = (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+
+    # Large faces gain nothing for the 150px chip, shrink the crop first
+    crop_scale = min(1.0, MAX_FACE_SIZE / max(1, right - left))
+    if crop_scale < 1.0:
+        crop = crop.resize(
+            (round(crop.width * crop_scale), round(crop.height * crop_scale)),
+            Image.BILINEAR,
+        )
+        box = tuple(int(round(v * crop_scale)) for v in box)
+
+    encodings = face_recognition.face_encodings(
+        np.asarray(crop), known_face_locations=[box]
+    )
+    return encodings[0] if encodings else None
+
+
+def _distances(queries, matrix):
+    # |q - g|^2 = |q|^2 - 2 q.g + |g|^2
+    squared = (
+        np.einsum("ij,ij->i", queries, queries)[:, None]
+        - 2.0 * queries @ matrix.T
+        + np.einsum("ij,ij->i", matrix, matrix)[None, :]
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def _limits(query_names, row_names, threshold, sample_threshold):
+    same = query_names[:, None] == row_names[None, :]
+    return np.where(same, sample_threshold, threshold)
+
+
+def find_duplicates(
+    samples,
+    names,
+    encodings,
+    threshold=DUPLICATE_THRESHOLD,
+    sample_threshold=SAMPLE_THRESHOLD,
+):
+    """Return, per new face, the identity it duplicates, or None.
+
+    samples is the gallery as {name: [encoding, ...]} and names[i] is the
+    identity encodings[i] is being enrolled as. A new face duplicates another
+    identity closer than threshold, or a sample of its own identity closer
+    than sample_threshold. All new faces are compared with every stored
+    sample in one vectorized query, and with the accepted new faces before
+    them, so one person enrolled twice in the same batch is caught as well.
+    """
+    queries = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSION)
+    query_names = np.array(names, dtype=object)
+    row_names, rows = samples_to_rows(samples)
+    matrix = np.asarray(rows, dtype=np.float32).reshape(-1, DIMENSION)
+    row_names = np.array(row_names, dtype=object)
+
+    to_gallery = _distances(queries, matrix)
+    to_gallery[
+        to_gallery >= _limits(query_names, row_names, threshold, sample_threshold)
+    ] = np.inf
+    to_batch = _distances(queries, queries)
+    to_batch[
+        to_batch >= _limits(query_names, query_names, threshold, sample_threshold)
+    ] = np.inf
+
+    duplicates = []
+    accepted = np.zeros(len(queries), dtype=bool)
+    for i in range(len(queries)):
+        duplicate = None
+        if len(matrix) and np.isfinite(to_gallery[i].min()):
+            duplicate = row_names[np.argmin(to_gallery[i])]
+        elif i:
+            earlier = np.where(accepted[:i], to_batch[i, :i], np.inf)
+            if np.isfinite(earlier.min()):
+                duplicate = query_names[np.argmin(earlier)]
+        accepted[i] = duplicate is None
+        duplicates.append(duplicate)
+    return duplicates
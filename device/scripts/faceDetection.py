@@ -0,0 +1,57 @@
+import cv2
+import dlib
+
+DETECTION_SCALE = 1.0  # run the HOG detector on a copy scaled by this factor
+DETECTION_PYRAMID = ()  # extra scales, e.g. (1.0,) to keep range when downscaling
+DETECTION_UPSAMPLE = 0  # dlib upsampling passes per scale
+
+
+def scale_rectangle(rect, scale, width, height):
+    """Map a detection from a scaled copy back to full-resolution coordinates."""
+    return dlib.rectangle(
+        max(0, int(round(rect.left() / scale))),
+        max(0, int(round(rect.top() / scale))),
+        min(width - 1, int(round(rect.right() / scale))),
+        min(height - 1, int(round(rect.bottom() / scale))),
+    )
+
+
+def iou(a, b):
+    """Intersection over union of two dlib rectangles."""
+    intersection = a.intersect(b)
+    if intersection.is_empty():
+        return 0.0
+    overlap = intersection.area()
+    return overlap / float(a.area() + b.area() - overlap)
+
+
+def detect_faces(
+    rgb_frame,
+    face_detector,
+    scale=DETECTION_SCALE,
+    pyramid=DETECTION_PYRAMID,
+    upsample=DETECTION_UPSAMPLE,
+    overlap=0.4,
+):
+    """Detect faces on (optionally downscaled) copies of the frame.
+
+    Returns dlib rectangles in full-resolution coordinates, so landmarks and
+    descriptors can still be computed on the full-resolution pixels.
+    Detections from different pyramid levels that overlap are merged.
+    """
+    height, width = rgb_frame.shape[:2]
+    faces = dlib.rectangles()
+    for level in (scale,) + tuple(pyramid):
+        if level == 1.0:
+            image = rgb_frame
+        else:
+            image = cv2.resize(
+                rgb_frame,
+                (int(width * level), int(height * level)),
+                interpolation=cv2.INTER_AREA,
+            )
+        for detection in face_detector(image, upsample):
+            rect = scale_rectangle(detection, level, width, height)
+            if all(iou(rect, face) < overlap for face in faces):
+                faces.append(rect)
+    return faces
@@ -0,0 +1,206 @@
+from collections import namedtuple
+
+import numpy as np
+
+FACE_ENCODING_SIZE = 128
+MATCH_THRESHOLD = 0.6  # maximum distance for a face to count as a known person
+IVF_MIN_SAMPLES = 8000  # below this an exact scan is faster (see benchGallery.py)
+IVF_PROBES = 8  # clusters searched per query
+IVF_ITERATIONS = 10  # k-means iterations when building the clusters
+
+# Immutable snapshot of the gallery, swapped as a whole on rebuild. Rows are
+# sorted by identity: rows starts[i] .. starts[i + 1] belong to names[i].
+GalleryIndex = namedtuple(
+    "GalleryIndex", ["names", "matrix", "squared_norms", "labels", "starts", "ivf"]
+)
+
+# Inverted file: rows grouped by their nearest centroid
+IvfIndex = namedtuple("IvfIndex", ["centroids", "centroid_norms", "lists"])
+
+
+class FaceGallery:
+    """Vectorized index of known face encodings.
+
+    Keeps the encodings as one contiguous float32 matrix with precomputed
+    squared norms, so all faces in a frame are matched with a single matrix
+    product instead of a Python loop over every known person. An identity
+    may have several samples; its distance is that of its closest sample.
+    Large galleries are searched through k-means clusters (an inverted
+    file) that only scan the rows of the IVF_PROBES nearest clusters.
+    """
+
+    def __init__(
+        self,
+        encodings=None,
+        threshold=MATCH_THRESHOLD,
+        ivf_min_samples=IVF_MIN_SAMPLES,
+        probes=IVF_PROBES,
+    ):
+        self.threshold = threshold
+        self.ivf_min_samples = ivf_min_samples
+        self.probes = probes
+        self._index = self._build_index({})
+        if encodings:
+            self.rebuild(encodings)
+
+    def __len__(self):
+        return len(self._index.names)
+
+    @property
+    def names(self):
+        return list(self._index.names)
+
+    @property
+    def samples(self):
+        return len(self._index.matrix)
+
+    def rebuild(self, encodings):
+        """Replace the gallery with a {name: encoding} dict or a galleryFormat.Gallery.
+
+        A Gallery may repeat a name on several rows, one per sample. The new
+        index is built aside and swapped in with one assignment, so
+        concurrent match() calls see either the old or the new gallery.
+        """
+        self._index = self._build_index(encodings)
+
+    def _build_index(self, encodings):
+        if isinstance(encodings, dict):
+            row_names = list(encodings.keys())
+            rows = list(encodings.values())
+        else:
+            # A loaded gallery file already holds one float32 matrix
+            row_names, rows = encodings.names, encodings.matrix
+        # Always copy, so a memory-mapped file can be replaced by the next sync
+        matrix = np.array(rows, dtype=np.float32).reshape(-1, FACE_ENCODING_SIZE)
+
+        names, labels = np.unique(
+            np.array(row_names, dtype=object), return_inverse=True
+        )
+        order = np.argsort(labels, kind="stable")
+        matrix = np.ascontiguousarray(matrix[order])
+        labels = labels[order]
+        starts = np.searchsorted(labels, np.arange(len(names)))
+        squared_norms = np.einsum("ij,ij->i", matrix, matrix)
+
+        ivf = None
+        if len(matrix) and len(matrix) >= self.ivf_min_samples:
+            ivf = self._build_ivf(matrix, squared_norms)
+        return GalleryIndex(names, matrix, squared_norms, labels, starts, ivf)
+
+    @staticmethod
+    def _build_ivf(matrix, squared_norms):
+        """Cluster the rows with a few rounds of k-means (Lloyd's algorithm)."""
+        clusters = max(1, int(np.sqrt(len(matrix))))
+        rng = np.random.default_rng(0)
+        centroids = matrix[rng.choice(len(matrix), clusters, replace=False)].copy()
+        for _ in range(IVF_ITERATIONS):
+            centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+            assignment = np.argmin(
+                _squared_distances(matrix, squared_norms, centroids, centroid_norms),
+                axis=1,
+            )
+            counts = np.bincount(assignment, minlength=clusters)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, matrix)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        assignment = np.argmin(
+            _squared_distances(matrix, squared_norms, centroids, centroid_norms),
+            axis=1,
+        )
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(clusters + 1))
+        lists = [order[bounds[i] : bounds[i + 1]] for i in range(clusters)]
+        return IvfIndex(centroids, centroid_norms, lists)
+
+    def distances(self, face_encodings):
+        """Return a (faces x identities) matrix of exact Euclidean distances."""
+        return self._distances(self._index, face_encodings)
+
+    @staticmethod
+    def _distances(index, face_encodings):
+        queries = _as_queries(face_encodings)
+        if not len(index.names) or not len(queries):
+            return np.empty((len(queries), len(index.names)), dtype=np.float32)
+        squared = _squared_distances(
+            queries,
+            np.einsum("ij,ij->i", queries, queries),
+            index.matrix,
+            index.squared_norms,
+        )
+        # Closest sample per identity, rows are grouped by identity
+        per_identity = np.minimum.reduceat(squared, index.starts, axis=1)
+        return np.sqrt(per_identity)
+
+    def _candidates(self, index, query, k):
+        """Approximate (identity ids, distances) for one query through the IVF."""
+        ivf = index.ivf
+        query_norm = np.dot(query, query)
+        to_centroids = query_norm - 2.0 * ivf.centroids @ query + ivf.centroid_norms
+        probes = min(self.probes, len(ivf.lists))
+        nearest = np.argpartition(to_centroids, probes - 1)[:probes]
+        rows = np.concatenate([ivf.lists[i] for i in nearest])
+
+        squared = (
+            query_norm - 2.0 * index.matrix[rows] @ query + index.squared_norms[rows]
+        )
+        # Closest sample per identity among the candidate rows
+        order = np.lexsort((squared, index.labels[rows]))
+        labels = index.labels[rows][order]
+        first = np.r_[True, labels[1:] != labels[:-1]]
+        identities = labels[first]
+        best = np.sqrt(np.maximum(squared[order][first], 0.0))
+
+        k = min(k, len(identities))
+        top = np.argsort(best)[:k]
+        return identities[top], best[top]
+
+    def match(self, face_encodings, k=1):
+        """Return the k closest identities as [(name, distance), ...] per face."""
+        index = self._index
+        if index.ivf is not None:
+            results = []
+            for query in _as_queries(face_encodings):
+                identities, best = self._candidates(index, query, k)
+                results.append(
+                    list(zip(index.names[identities].tolist(), best.tolist()))
+                )
+            return results
+
+        distances = self._distances(index, face_encodings)
+        if not distances.size:
+            return [[] for _ in range(len(distances))]
+
+        k = min(k, distances.shape[1])
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+        return [
+            list(zip(index.names[row].tolist(), row_distances.tolist()))
+            for row, row_distances in zip(nearest, nearest_distances)
+        ]
+
+    def identify(self, face_encodings):
+        """Return the best matching name per face, or "Unknown"."""
+        names = []
+        for matches in self.match(face_encodings, k=1):
+            if matches and matches[0][1] < self.threshold:
+                names.append(matches[0][0])
+            else:
+                names.append("Unknown")
+        return names
+
+
+def _as_queries(face_encodings):
+    return np.asarray(face_encodings, dtype=np.float32).reshape(-1, FACE_ENCODING_SIZE)
+
+
+def _squared_distances(queries, query_norms, matrix, matrix_norms):
+    # |q - g|^2 = |q|^2 - 2 q.g + |g|^2
+    squared = query_norms[:, None] - 2.0 * queries @ matrix.T + matrix_norms[None, :]
+    np.maximum(squared, 0.0, out=squared)
+    return squared
@@ -0,0 +1,188 @@
+import itertools
+import time
+
+from faceDetection import iou
+
+
+class FaceTrack:
+    """A face followed across frames together with its cached identity."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, rect, now):
+        self.track_id = next(self._ids)
+        self.rect = rect
+        self.name = None
+        self.distance = None
+        self.first_seen = now
+        self.last_seen = now
+        self.last_described = None
+        self.unknown_since = None
+        self.reported_at = None  # when this track last started an event
+        self.misses = 0
+
+    @property
+    def location(self):
+        """(top, right, bottom, left) like face_recognition returns."""
+        rect = self.rect
+        return (rect.top(), rect.right(), rect.bottom(), rect.left())
+
+
+class FaceTracker:
+    """Associate detections across frames and reuse each track's identity.
+
+    Detections are matched to existing tracks by IoU. The 128-d descriptor is
+    only computed for new tracks, for tracks whose match distance is close to
+    the gallery threshold, and when a track's refresh interval expires.
+    An unknown face that stays in view is reported again once
+    report_interval has passed since it last started an event.
+    """
+
+    def __init__(
+        self,
+        face_gallery,
+        confirm_duration,
+        iou_threshold=0.3,
+        refresh_interval=5.0,
+        confidence_margin=0.05,
+        max_misses=5,
+        report_interval=None,
+    ):
+        self.face_gallery = face_gallery
+        self.confirm_duration = confirm_duration
+        self.iou_threshold = iou_threshold
+        self.refresh_interval = refresh_interval
+        self.confidence_margin = confidence_margin
+        self.max_misses = max_misses
+        self.report_interval = report_interval
+        self.tracks = []
+        self.last_update = None
+
+        self.descriptors_computed = 0
+        self.descriptors_reused = 0
+
+    def update(self, detections, describe, now=None):
+        """Update tracks with this frame's detections and return the live tracks.
+
+        describe(index) must return the descriptor for detections[index]; it
+        is only called for detections whose identity has to be refreshed.
+        """
+        now = time.time() if now is None else now
+        self.last_update = now
+        matched = self._associate(detections)
+
+        to_describe = []
+        for index, rect in enumerate(detections):
+            track = matched.get(index)
+            if track is None:
+                track = FaceTrack(rect, now)
+                self.tracks.append(track)
+            track.rect = rect
+            track.last_seen = now
+            track.misses = 0
+            if self._needs_descriptor(track, now):
+                to_describe.append((index, track))
+            else:
+                self.descriptors_reused += 1
+
+        for track in self.tracks:
+            if track.last_seen != now:
+                track.misses += 1
+        self.tracks = [
+            track for track in self.tracks if track.misses <= self.max_misses
+        ]
+
+        if to_describe:
+            descriptors = [describe(index) for index, _ in to_describe]
+            self.descriptors_computed += len(descriptors)
+            # One matrix operation for every face that needed a new descriptor
+            matches = self.face_gallery.match(descriptors, k=1)
+            for (_, track), best in zip(to_describe, matches):
+                self._set_identity(track, best, now)
+
+        return [track for track in self.tracks if track.last_seen == now]
+
+    def confirmed_unknown(self, now=None):
+        """Return tracks in the latest frame that stayed unknown for confirm_duration.
+
+        Tracks missed in that frame are left out, their boxes are stale.
+        """
+        now = time.time() if now is None else now
+        return [
+            track
+            for track in self.tracks
+            if track.last_seen == self.last_update
+            and self._can_report(track, now)
+            and track.unknown_since is not None
+            and now - track.unknown_since >= self.confirm_duration
+        ]
+
+    def mark_reported(self, tracks, now=None):
+        """Hold back tracks that just started an event until report_interval passes."""
+        now = time.time() if now is None else now
+        for track in tracks:
+            track.reported_at = now
+
+    def clear(self):
+        self.tracks = []
+
+    def stats(self):
+        return {
+            "tracks": len(self.tracks),
+            "descriptors_computed": self.descriptors_computed,
+            "descriptors_reused": self.descriptors_reused,
+        }
+
+    def _associate(self, detections):
+        """Greedy IoU matching, returns {detection index: track}."""
+        pairs = sorted(
+            (
+                (iou(rect, track.rect), index, track)
+                for index, rect in enumerate(detections)
+                for track in self.tracks
+            ),
+            key=lambda pair: pair[0],
+            reverse=True,
+        )
+        matched = {}
+        used = set()
+        for overlap, index, track in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if index in matched or track.track_id in used:
+                continue
+            matched[index] = track
+            used.add(track.track_id)
+        return matched
+
+    def _can_report(self, track, now):
+        if track.reported_at is None:
+            return True
+        return (
+            self.report_interval is not None
+            and now - track.reported_at >= self.report_interval
+        )
+
+    def _needs_descriptor(self, track, now):
+        if track.last_described is None:
+            return True
+        if now - track.last_described >= self.refresh_interval:
+            return True
+        # Matches close to the threshold are re-checked on every frame
+        return (
+            track.distance is not None
+            and abs(track.distance - self.face_gallery.threshold)
+            < self.confidence_margin
+        )
+
+    def _set_identity(self, track, best, now):
+        track.last_described = now
+        if best and best[0][1] < self.face_gallery.threshold:
+            track.name, track.distance = best[0]
+            track.unknown_since = None
+            track.reported_at = None
+        else:
+            track.name = "Unknown"
+            track.distance = best[0][1] if best else None
+            if track.unknown_since is None:
+                track.unknown_since = now
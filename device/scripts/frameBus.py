@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+
+
+class FrameBus:
+    """In-process ring of preallocated frame slots with sequence numbers.
+
+    A single producer publishes frames with publish(); any number of
+    subscribers call wait_for_frame() with the last sequence number they saw.
+    Subscribers copy frames out of the ring without holding the producer's
+    lock, and a subscriber that falls more than a ring behind skips ahead
+    instead of holding the producer back.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._slots = [np.empty(self.shape, dtype=self.dtype) for _ in range(slots)]
+        self._sequences = [0] * slots  # sequence held by each slot, -1 while writing
+        self._sequence = 0  # sequence number of the newest frame, 0 = none yet
+        self._condition = threading.Condition()
+        self._closed = False
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, frame):
+        """Copy frame into the next slot and wake up subscribers."""
+        if frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError(
+                f"Frame {frame.shape}/{frame.dtype} does not fit bus "
+                f"{self.shape}/{self.dtype}"
+            )
+        sequence = self._sequence + 1
+        index = sequence % len(self._slots)
+        self._sequences[index] = -1
+        np.copyto(self._slots[index], frame)
+        self._sequences[index] = sequence
+        with self._condition:
+            self._sequence = sequence
+            self._condition.notify_all()
+        return sequence
+
+    def wait_for_frame(self, last_sequence=0, timeout=None, latest=False):
+        """Return (sequence, frame) for a frame published after last_sequence.
+
+        By default frames are delivered in order, skipping only those already
+        overwritten in the ring; with latest=True the newest frame is returned.
+        Returns (last_sequence, None) on timeout or once the bus is closed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._sequence > last_sequence or self._closed, timeout
+            ):
+                return last_sequence, None
+
+        while not self._closed:
+            newest = self._sequence
+            if latest:
+                sequence = newest
+            else:
+                # Keep a slot of headroom for the frame being written
+                sequence = max(last_sequence + 1, newest - len(self._slots) + 2)
+            index = sequence % len(self._slots)
+            frame = self._slots[index].copy()
+            if self._sequences[index] == sequence:
+                return sequence, frame
+            # The producer lapped us while copying, retry closer to the head
+        return last_sequence, None
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
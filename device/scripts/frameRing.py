@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+
+class FrameRing:
+    """Fixed-capacity ring of frames with O(1) append and trim.
+
+    Items are either decoded numpy frames or JPEG bytes; decode_frame() turns
+    either into a BGR frame when it is actually needed.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._head = 0  # index of the oldest item
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, item):
+        """Add an item, overwriting the oldest one when the ring is full."""
+        index = (self._head + self._count) % self.capacity
+        self._items[index] = item
+        if self._count < self.capacity:
+            self._count += 1
+        else:
+            self._head = (self._head + 1) % self.capacity
+
+    def latest(self):
+        if not self._count:
+            return None
+        return self._items[(self._head + self._count - 1) % self.capacity]
+
+    def trim(self, keep):
+        """Forget all but the newest `keep` items without moving any of them."""
+        if keep < self._count:
+            self._head = (self._head + self._count - keep) % self.capacity
+            self._count = keep
+
+    def snapshot(self):
+        """Return the items from oldest to newest as a list of references."""
+        end = self._head + self._count
+        if end <= self.capacity:
+            return self._items[self._head : end]
+        return self._items[self._head :] + self._items[: end - self.capacity]
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._head = 0
+        self._count = 0
+
+
+def encode_frame(frame, quality=90):
+    """Compress a BGR frame to JPEG bytes for storage in the ring."""
+    ret, buffer = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes() if ret else None
+
+
+def decode_frame(item):
+    """Return a BGR frame for a ring item, decoding JPEG bytes if needed."""
+    if isinstance(item, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(item, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return item
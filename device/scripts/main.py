@@ -4,37 +4,82 @@ import numpy as np
 import pickle
 import os
 import time
-from collections import deque
 import threading
-import subprocess
 import sendFile as sf
 import uuid
 from dotenv import load_dotenv
-import deviceStream
+from mjpegDemuxer import MjpegDemuxer
+from frameRing import FrameRing, decode_frame, encode_frame
+from faceGallery import FaceGallery
+from galleryFormat import GalleryFormatError, read_gallery
+from encodingsSync import EncodingsSync
+from motionGate import MotionGate
+from faceDetection import detect_faces
+from faceTracker import FaceTracker
+from detectionScheduler import DetectionScheduler
+from detectionWorkers import DetectionWorkerPool
+from clipWriter import write_clip
+from clipWorker import ClipJob, ClipWorker
+from uploadSpool import UploadSpool
+from segmentRecorder import SegmentRecorder
+from progressiveClip import ProgressiveClip
 import requests
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
-import json
 
 
 # Configuration and constants
 ENCODINGS_FILE = "../data/encodings.dat"
+ENCODINGS_SYNC_INTERVAL = 30 * 60  # fallback poll, Firestore signals changes sooner
 SHAPE_PREDICTOR_FILE = "../models/shape_predictor_68_face_landmarks.dat"
 FACE_RECOGNITION_MODEL_FILE = "../models/dlib_face_recognition_resnet_model_v1.dat"
 VIDEO_DIRECTORY = "../videos"
 IMAGE_DIRECTORY = "../images"
+SPOOL_DIRECTORY = "../spool"
+RECORDING_DIRECTORY = os.path.join(VIDEO_DIRECTORY, "recording")
+SEGMENT_SECONDS = 4  # length of each continuously recorded segment
+RECORDING_RING_SECONDS = 5 * 60  # disk ring size, bounds the possible pre-roll
+PRE_ROLL_SECONDS = 15  # recording kept before a detection
+POST_ROLL_SECONDS = 15  # recording kept after a detection
+UPLOAD_WORKERS = 2  # concurrent uploads to the server
+ALERT_LATENCY_SLO = 10  # seconds from detection to the server acknowledging the alert
 MIN_WAIT_DURATION = 2 * 60  # 2 minutes
 MIN_TIME_DETECT_DURATION = 2  # 2 seconds for detection to be considered valid
-
-# Load environment variables
-load_dotenv()
+MJPEG_CHUNK_SIZE = 64 * 1024  # bytes read from the video feed per iteration
+MOTION_GATING = True  # only run face detection when the scene changes
+MOTION_SENSITIVITY = 0.005  # fraction of changed pixels that counts as motion
+MOTION_COOLDOWN = 5  # seconds to keep detecting after the last motion
+FACE_TRACK_REFRESH = 5  # seconds before a tracked face is described again
+DETECTION_SCALE = 1.0  # below 1 the detector runs faster but misses distant faces
+DETECTION_PYRAMID = ()  # extra detector scales, e.g. (1.0,) alongside a 0.5 scale
+DETECTION_STATS_INTERVAL = 10 * 60  # 10 minutes between detector counter reports
+
+# Load environment variables; spawned detection workers inherit them, and
+# only re-import this module, so they skip this and the Firebase setup below
+if __name__ == "__main__":
+    load_dotenv()
 EMAIL = os.getenv("EMAIL")
 PASSWORD = os.getenv("PASSWORD")
 DEVICE_LOCATION = os.getenv("LOCATION")
 DEVICE_ID = os.getenv("DEVICE_ID")
 API_KEY = os.getenv("API_KEY")
 STORAGE_BUCKET = os.getenv("STORAGE_BUCKET")
+# "bus" reads frames in-process from DeviceStream, "http" uses the loopback feed
+FRAME_SOURCE = os.getenv("FRAME_SOURCE", "bus")
+# "raw" buffers decoded frames, "jpeg" buffers compressed frames (~10-20x less RAM),
+# "segments" records continuously to a ring of short segments on disk
+BUFFER_MODE = os.getenv("BUFFER_MODE", "raw")
+# Upload event clips as fragmented MP4 pieces while they are still recording
+PROGRESSIVE_CLIPS = os.getenv("PROGRESSIVE_CLIPS", "0") == "1"
+# Number of detector processes, 0 runs detection in a thread of this process
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", "0"))
+FRAME_SHAPE = (720, 1280, 3)  # frame size on the loopback feed
 PORT = None
+device_stream = None
+detection_pool = None
+upload_spool = None
+segment_recorder = None
+encodings_sync = None
 RECOGNIZE_FACES = False
 recognition_started = False
 
@@ -44,11 +89,17 @@ detection_thread = None
 stop_capture_thread = False
 stop_detection_thread = False
 
+db = None
+
+
 # Firebase Initialization
-if not firebase_admin._apps:
-    cred = credentials.Certificate("../data/admin.json")
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
+def initialize_firebase():
+    global db
+    if not firebase_admin._apps:
+        cred = credentials.Certificate("../data/admin.json")
+        firebase_admin.initialize_app(cred)
+    db = firestore.client()
+
 
 # Condition variable for face recognition
 condition = threading.Condition()
@@ -66,6 +117,9 @@ def on_snapshot(doc_snapshot, changes, read_time):
                 with condition:
                     RECOGNIZE_FACES = new_value
                     condition.notify()
+            if "encodingsGeneration" in doc.to_dict() and encodings_sync is not None:
+                # The server saved a new gallery, fetch it without waiting
+                encodings_sync.notify()
 
 
 def get_initial_recognize_faces_value():
@@ -89,13 +143,6 @@ def setup_firestore_listener(user_id):
     doc_watch = doc_ref.on_snapshot(on_snapshot)
 
 
-def check_for_encodings_update(interval=1800):
-    """Check for updates to the encodings.dat file periodically. 30 minutes by default."""
-    while True:
-        download_encodings()
-        time.sleep(interval)
-
-
 # Helper functions
 def authenticate_user(email, password):
     url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={API_KEY}"
@@ -110,62 +157,64 @@ def authenticate_user(email, password):
         return None, None
 
 
-def download_encodings():
-    """Download the encodings.dat file from Firebase Storage."""
-    bucket = storage.bucket(STORAGE_BUCKET)
-    blob = bucket.blob(f"{user_id}/encodings.dat")
-    local_path = ENCODINGS_FILE
-
-    if blob.exists():
-        blob.download_to_filename(local_path)
-        print("Encodings file downloaded successfully.")
-    else:
-        print("Encodings file not found in Firebase Storage.")
-
-
 def load_encodings(filename=ENCODINGS_FILE):
-    """Load face encodings from a JSON file."""
-    download_encodings()
+    """Load the face gallery, old JSON files are converted on the fly."""
+    try:
+        encodings_sync.sync()  # only downloads when Storage has a newer file
+    except Exception as e:
+        print(f"Error syncing encodings: {e}")
     if os.path.exists(filename):
-        with open(filename, "r") as file:
-            return json.load(file)
+        try:
+            return read_gallery(filename)
+        except (OSError, GalleryFormatError) as e:
+            print(f"Error loading encodings: {e}")
     return {}
 
 
 # Face recognition functions
 
 
+def describe_face(rgb_frame, detection, shape_predictor, face_recognition_model):
+    """Compute the 128-d descriptor for one detected face."""
+    shape = shape_predictor(rgb_frame, detection)
+    return np.array(face_recognition_model.compute_face_descriptor(rgb_frame, shape))
+
+
 def process_frame(
-    frame, known_face_encodings, face_detector, shape_predictor, face_recognition_model
+    frame,
+    face_gallery,
+    face_detector,
+    shape_predictor,
+    face_recognition_model,
+    face_tracker=None,
 ):
     """Process a single frame for face recognition using dlib."""
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    detections = face_detector(rgb_frame)
+    # Boxes come back in full-resolution coordinates whatever the scale
+    detections = detect_faces(
+        rgb_frame, face_detector, scale=DETECTION_SCALE, pyramid=DETECTION_PYRAMID
+    )
+
+    def describe(index):
+        return describe_face(
+            rgb_frame, detections[index], shape_predictor, face_recognition_model
+        )
+
+    if face_tracker is not None:
+        # Tracked faces keep their identity, only new or stale ones are described
+        tracks = face_tracker.update(detections, describe)
+        return [track.location for track in tracks], [track.name for track in tracks]
 
     face_locations = []
     face_encodings = []
-    for detection in detections:
-        shape = shape_predictor(rgb_frame, detection)
-        face_encoding = np.array(
-            face_recognition_model.compute_face_descriptor(rgb_frame, shape)
-        )
-        face_encodings.append(face_encoding)
-
+    for index, detection in enumerate(detections):
+        face_encodings.append(describe(index))
         face_locations.append(
             (detection.top(), detection.right(), detection.bottom(), detection.left())
         )
 
-    face_names = []
-    for face_encoding in face_encodings:
-        distances = np.linalg.norm(
-            list(known_face_encodings.values()) - face_encoding, axis=1
-        )
-        best_match_index = np.argmin(distances)
-        if distances[best_match_index] < 0.6:  # adjust threshold as needed
-            name = list(known_face_encodings.keys())[best_match_index]
-        else:
-            name = "Unknown"
-        face_names.append(name)
+    # Match every face in the frame against the whole gallery at once
+    face_names = face_gallery.identify(face_encodings)
 
     return face_locations, face_names
 
@@ -180,63 +229,121 @@ def draw_results(frame, face_locations, face_names):
         )
 
 
-def save_buffer_to_file(buffer, filename, save_first_image, event_id, face_frame=0):
+def save_buffer_to_file(
+    buffer, filename, save_first_image, event_id, face_frame=0, fps=30
+):
     if not buffer:
         print("No data in buffer to save")
         return
 
     print(f"Number of frames in buffer: {len(buffer)}")
-    frame_height, frame_width = buffer[0].shape[:2]
-    print(f"Frame dimensions: {frame_width}x{frame_height}")
 
     os.makedirs(VIDEO_DIRECTORY, exist_ok=True)
     os.makedirs(IMAGE_DIRECTORY, exist_ok=True)
     video_path = os.path.join(VIDEO_DIRECTORY, filename)
 
-    fourcc = cv2.VideoWriter_fourcc(*"XVID")
-    out = cv2.VideoWriter(video_path, fourcc, 30.0, (frame_width, frame_height))
-
-    for i, frame in enumerate(buffer):
-        if i == face_frame and save_first_image:
+    if save_first_image and face_frame < len(buffer):
+        frame = decode_frame(buffer[face_frame])
+        if frame is not None:
             image_path = os.path.join(IMAGE_DIRECTORY, f"{event_id}.jpg")
             cv2.imwrite(image_path, frame)
-            sf.sendFile(image_path, DEVICE_ID, DEVICE_LOCATION, id_token, event_id)
+            upload_spool.enqueue(image_path, event_id)
             print(f"Saved image to {image_path}")
 
-        out.write(frame)
-
-    out.release()
-    re_encode_video(video_path)
+    # One pass straight to the final bitrate-capped H.264 file
+    clip_stats = write_clip(buffer, video_path, fps)
+    if clip_stats is None:
+        return None
+    print(f"Clip {event_id}: {clip_stats}")
     return video_path
 
 
-def re_encode_video(filepath, bitrate="1860k"):
-    # Create a temporary output file name
-    tmp_filepath = filepath + ".tmp.mp4"
+def upload_spooled_file(item):
+    """Upload one spooled file, called by the spool's uploader threads."""
+    if item.path.endswith(".mp4"):
+        # Clips resume from the last acknowledged chunk instead of restarting
+        return sf.sendFileChunked(
+            item.path, DEVICE_ID, DEVICE_LOCATION, id_token, item.event_id
+        )
+    return sf.sendFile(item.path, DEVICE_ID, DEVICE_LOCATION, id_token, item.event_id)
 
-    command = [
-        "../ffmpeg",
-        "-y",
-        "-i",
-        filepath,
-        "-b:v",
-        bitrate,
-        "-bufsize",
-        bitrate,
-        tmp_filepath,
-    ]
-    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    # Replace the original file with the new re-encoded file
-    os.replace(tmp_filepath, filepath)
+def send_alert_snapshot(event_id, frame, face_locations, face_names, detected_at):
+    """Upload the detection frame right away, the clip follows under the same event."""
+    os.makedirs(IMAGE_DIRECTORY, exist_ok=True)
+    snapshot = frame.copy()
+    draw_results(snapshot, face_locations, face_names)
+    image_path = os.path.join(IMAGE_DIRECTORY, f"{event_id}.jpg")
+    cv2.imwrite(image_path, snapshot)
+    upload_spool.enqueue(image_path, event_id, detected_at=detected_at)
+    print(f"Sent alert snapshot {image_path}")
+
+
+def start_progressive_clip(event_id, fps, preroll, max_pending):
+    """Fragmented MP4 clip whose pieces are uploaded as soon as they close."""
+
+    def upload(index, data, final):
+        return sf.sendSegment(
+            data, index, final, DEVICE_ID, DEVICE_LOCATION, id_token, event_id
+        )
+
+    def upload_whole_clip(video_path):
+        # The pieces could not be sent, the spool retries the full clip
+        upload_spool.enqueue(video_path, event_id)
+        print(f"Queued progressive clip {video_path} for a full upload")
+
+    return ProgressiveClip(
+        os.path.join(VIDEO_DIRECTORY, f"{event_id}.mp4"),
+        fps,
+        upload,
+        preroll=preroll,
+        on_failed=upload_whole_clip,
+        max_pending=max_pending,
+    )
+
+
+def save_segments_to_file(recorder, job, filename):
+    """Cut an event clip from the recorded segments."""
+    start_time, end_time = job.segment_range
+    return recorder.assemble_clip(
+        start_time, end_time, os.path.join(VIDEO_DIRECTORY, filename)
+    )
+
+
+def finalize_clip(job):
+    """Encode an event clip and upload it, runs on the clip worker thread."""
+    filename = f"{job.event_id}.mp4"
+    if job.segment_range is not None:
+        video_path = save_segments_to_file(segment_recorder, job, filename)
+    else:
+        # The snapshot already went out as the alert in process_detection
+        video_path = save_buffer_to_file(
+            job.frames, filename, False, job.event_id, job.face_frame, job.fps
+        )
+    if video_path is not None:
+        print(f"Saved video to {filename}")
+        upload_spool.enqueue(video_path, job.event_id)
+        print(f"Queued video for upload")
 
 
 class BufferManager:
-    def __init__(self, fps):
+    def __init__(self, fps, clip_worker, buffer_mode=BUFFER_MODE, detection_stride=1):
         self.fps = fps
-        self.pre_detection_buffer_size = int(self.fps * 15)  # 15 seconds of frames
-        self.total_buffer_size = int(self.fps * 30)  # 30 seconds of frames
-        self.buffer = deque(maxlen=self.total_buffer_size)
+        self.clip_worker = clip_worker
+        self.buffer_mode = buffer_mode
+        self.pre_detection_buffer_size = int(self.fps * PRE_ROLL_SECONDS)
+        self.total_buffer_size = int(self.fps * (PRE_ROLL_SECONDS + POST_ROLL_SECONDS))
+        if buffer_mode == "segments":
+            # Frames live on disk, RAM only holds the newest second for snapshots
+            self.buffer = FrameRing(int(self.fps))
+        else:
+            self.buffer = FrameRing(self.total_buffer_size)
+        self.event_end_time = None
+        # Progressive clips are encoded while recording, not from the segment ring
+        self.progressive = PROGRESSIVE_CLIPS and buffer_mode != "segments"
+        self.progressive_clip = None
+        self.progressive_frames_dropped = 0  # by finished progressive clips
+        self.scheduler = DetectionScheduler(fps, min_stride=detection_stride)
         self.face_detected = False
         self.lock = threading.Lock()
         self.event_id = None
@@ -244,65 +351,139 @@ class BufferManager:
         self.lastDetectionTime = time.time() - self.MIN_DETECTION_DURATION
 
     def add_frame(self, frame):
+        if self.buffer_mode == "jpeg":
+            frame = encode_frame(frame)
+            if frame is None:
+                return
+        self.add_item(frame)
+
+    def add_jpeg(self, jpg):
+        """Add a frame received as JPEG bytes, decoding it only in raw mode."""
+        if self.buffer_mode != "raw":
+            self.add_item(bytes(jpg))
+            return
+        frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            self.add_item(frame)
+
+    def add_item(self, frame):
         should_save = False
+        if self.buffer_mode == "segments":
+            segment_recorder.write(frame)
         with self.lock:
             self.buffer.append(frame)
+            if self.progressive_clip is not None:
+                self.progressive_clip.write(frame)
             # print(f"Buffer length: {len(self.buffer)}")
 
+            if self.buffer_mode == "segments":
+                # Segments are on disk already, wait out the post-roll by time
+                if self.face_detected and time.time() >= self.event_end_time:
+                    should_save = True
+                    self.face_detected = False
             # If face was detected, check if the buffer size reaches 30 seconds after detection
-            if self.face_detected and len(self.buffer) >= self.total_buffer_size:
+            elif self.face_detected and len(self.buffer) >= self.total_buffer_size:
                 should_save = True
                 self.face_detected = False
+        self.scheduler.submit(frame)
         if should_save:
             self.save_video()
 
-    def process_detection(self, face_detected):
+    def process_detection(
+        self, face_detected, frame=None, face_locations=(), face_names=()
+    ):
+        """Start an event for a confirmed face and send its alert snapshot."""
         if (
             face_detected
             and not self.face_detected
             and abs(self.lastDetectionTime - time.time()) >= self.MIN_DETECTION_DURATION
         ):
-            self.lastDetectionTime = time.time()
-            self.event_id = f"{uuid.uuid4().hex}_{int(time.time())}"
-            self.face_detected = True
-            # Adjust the buffer size to keep additional frames post-detection
-            self.buffer = deque(
-                list(self.buffer)[-self.pre_detection_buffer_size :],
-                maxlen=self.total_buffer_size,
-            )
+            # Start the event and trim in one step, so add_item never sees an
+            # event without its end time or with the full pre-event buffer
+            with self.lock:
+                self.lastDetectionTime = time.time()
+                self.event_id = f"{uuid.uuid4().hex}_{int(time.time())}"
+                self.face_detected = True
+                self.event_end_time = self.lastDetectionTime + POST_ROLL_SECONDS
+                # Keep only the pre-detection window so the post-detection frames fit
+                if self.buffer_mode != "segments":
+                    self.buffer.trim(self.pre_detection_buffer_size)
+                if self.progressive:
+                    # Encode the pre-roll now, live frames follow from add_item
+                    # The queue holds the whole post-roll, those frames are in
+                    # the ring anyway, so a slow encoder falls behind instead
+                    # of dropping the footage right after the detection
+                    self.progressive_clip = start_progressive_clip(
+                        self.event_id,
+                        self.fps,
+                        self.buffer.snapshot(),
+                        self.total_buffer_size - self.pre_detection_buffer_size,
+                    )
+                event_id, detected_at = self.event_id, self.lastDetectionTime
+            if frame is not None:
+                try:
+                    send_alert_snapshot(
+                        event_id, frame, face_locations, face_names, detected_at
+                    )
+                except Exception as e:
+                    print(f"Error sending alert snapshot: {e}")
+            return True
+        return False
 
     def save_video(self):
-        buffer_copy = None
-
-        with self.lock:
-            buffer_copy = list(self.buffer)
+        if self.progressive_clip is not None:
+            with self.lock:
+                progressive_clip = self.progressive_clip
+                self.progressive_clip = None
+                self.buffer.clear()
+                self.event_id = None
+            progressive_clip.finish()  # the last pieces upload in the background
+            self.progressive_frames_dropped += progressive_clip.frames_dropped
+            return
 
-        if buffer_copy is None:
+        if self.buffer_mode == "segments":
+            with self.lock:
+                start_time = self.lastDetectionTime - PRE_ROLL_SECONDS
+                job = ClipJob(
+                    self.event_id,
+                    [],
+                    0,
+                    self.fps,
+                    segment_range=(start_time, self.event_end_time),
+                )
+                self.event_id = None
+            self.clip_worker.submit(job)
             return
 
+        with self.lock:
+            buffer_copy = self.buffer.snapshot()
+            event_id = self.event_id
+            self.clear_buffer()
+
         print(f"Frames to save: {len(buffer_copy)}")
         if buffer_copy:
-            filename = f"{self.event_id}.mp4"
-            video_path = save_buffer_to_file(
-                buffer_copy,
-                filename,
-                True,
-                self.event_id,
-                int(self.fps * 15),
+            # Encoding and uploading happen on the clip worker, never on capture
+            job = ClipJob(
+                event_id, buffer_copy, self.pre_detection_buffer_size, self.fps
             )
-            print(f"Saved video to {filename}")
-            sf.sendFile(
-                video_path, DEVICE_ID, DEVICE_LOCATION, id_token, filename.split(".")[0]
-            )
-            print(f"Sent video to server")
+            self.clip_worker.submit(job)
 
-            self.clear_buffer()
+    def progressive_stats(self):
+        current = self.progressive_clip
+        return {
+            "recording": current is not None,
+            "frames_dropped": self.progressive_frames_dropped
+            + (current.frames_dropped if current is not None else 0),
+        }
 
-    def get_next_frame_for_processing(self):
-        with self.lock:
-            if self.buffer:
-                return self.buffer[-1]  # get the most recent frame
-            return None
+    def count_dropped_frames(self, count):
+        self.clip_worker.count_dropped_frames(count)
+
+    def get_next_frame_for_processing(self, timeout=None):
+        # Blocks until a new frame is due, each frame is handed out at most once
+        sequence, item = self.scheduler.next_frame(timeout)
+        # Only the frames the detector samples are decoded in jpeg mode
+        return decode_frame(item) if item is not None else None
 
     def clear_buffer(self):
         self.buffer.clear()
@@ -323,64 +504,182 @@ def frame_capture_thread(video_url, buffer_manager):
                 print(f"Failed to connect to {video_url}, Status code: {r.status_code}")
                 return
 
-            bytes_buffer = bytes()
-            for chunk in r.iter_content(chunk_size=1024):
-                bytes_buffer += chunk
-                a = bytes_buffer.find(b"\xff\xd8")  # JPEG start
-                b = bytes_buffer.find(b"\xff\xd9")  # JPEG end
-                if a != -1 and b != -1:
-                    jpg = bytes_buffer[a : b + 2]
-                    bytes_buffer = bytes_buffer[b + 2 :]
-                    frame = cv2.imdecode(
-                        np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR
-                    )
-                    if frame is not None:
-                        if stop_capture_thread:
-                            break
-                        buffer_manager.add_frame(frame)
+            demuxer = MjpegDemuxer()
+            for chunk in r.iter_content(chunk_size=MJPEG_CHUNK_SIZE):
+                if stop_capture_thread:
+                    break
+                for jpg in demuxer.feed(chunk):
+                    # jpg is a view into the demuxer buffer, use it before next feed
+                    buffer_manager.add_jpeg(jpg)
+
+
+def frame_bus_thread(frame_bus, buffer_manager):
+    global stop_capture_thread
+    sequence = frame_bus.sequence
+    while not stop_capture_thread:
+        new_sequence, frame = frame_bus.wait_for_frame(sequence, timeout=1)
+        if frame is None:
+            if frame_bus.closed:
+                print("Frame bus closed, stopping capture")
+                return
+            continue
+        if new_sequence - sequence > 1:
+            buffer_manager.count_dropped_frames(new_sequence - sequence - 1)
+        sequence = new_sequence
+        buffer_manager.add_frame(frame)
 
 
 def face_detection_thread(
     buffer_manager,
-    known_face_encodings,
+    face_gallery,
     face_detector,
     shape_predictor,
     face_recognition_model,
-    n,
 ):
     global stop_detection_thread
-    detection_start_time = None
+    motion_gate = MotionGate(MOTION_SENSITIVITY, cooldown=MOTION_COOLDOWN)
+    # Each tracked face runs its own MIN_TIME_DETECT_DURATION confirmation
+    face_tracker = FaceTracker(
+        face_gallery,
+        MIN_TIME_DETECT_DURATION,
+        refresh_interval=FACE_TRACK_REFRESH,
+        report_interval=MIN_WAIT_DURATION,
+    )
+    scheduler = buffer_manager.scheduler
+    last_stats_time = time.time()
+    while not stop_detection_thread:
+        # Wakes up as soon as a new frame is due instead of polling
+        frame = buffer_manager.get_next_frame_for_processing(timeout=1)
+        if frame is not None and buffer_manager.face_detected:
+            frame = None  # an event is already recording
+        if frame is not None and MOTION_GATING and not motion_gate.should_detect(frame):
+            # Static scene, skip the detector and restart the confirmation
+            frame = None
+            face_tracker.clear()
+        if frame is not None:
+            start_time = time.time()
+            face_locations, face_names = process_frame(
+                frame,
+                face_gallery,
+                face_detector,
+                shape_predictor,
+                face_recognition_model,
+                face_tracker,
+            )
+            scheduler.record_latency(time.time() - start_time)
+            confirmed = face_tracker.confirmed_unknown()
+            if confirmed and buffer_manager.process_detection(
+                True, frame, face_locations, face_names
+            ):
+                face_tracker.mark_reported(confirmed)
+        if time.time() - last_stats_time >= DETECTION_STATS_INTERVAL:
+            print_detection_stats(buffer_manager, motion_gate, face_tracker)
+            last_stats_time = time.time()
+    print_detection_stats(buffer_manager, motion_gate, face_tracker)
+
+
+def pooled_detection_thread(buffer_manager, face_gallery, detection_pool):
+    """Feed sampled frames to the worker pool and apply results in order."""
+    global stop_detection_thread
+    motion_gate = MotionGate(MOTION_SENSITIVITY, cooldown=MOTION_COOLDOWN)
+    face_tracker = FaceTracker(
+        face_gallery,
+        MIN_TIME_DETECT_DURATION,
+        refresh_interval=FACE_TRACK_REFRESH,
+        report_interval=MIN_WAIT_DURATION,
+    )
+    scheduler = buffer_manager.scheduler
+    sequence = 0
+    frames_in_flight = {}  # sequence -> frame, for the alert snapshot
+    last_stats_time = time.time()
     while not stop_detection_thread:
-        frame_counter = 0
-        if frame_counter % n == 0 and (not buffer_manager.face_detected):
-            frame = buffer_manager.get_next_frame_for_processing()
+        # Keep every worker busy without queueing stale frames
+        if detection_pool.in_flight() < detection_pool.workers:
+            frame = buffer_manager.get_next_frame_for_processing(timeout=0.05)
+            if frame is not None and buffer_manager.face_detected:
+                frame = None
+            if (
+                frame is not None
+                and MOTION_GATING
+                and not motion_gate.should_detect(frame)
+            ):
+                frame = None
+                face_tracker.clear()
             if frame is not None:
-                face_locations, face_names = process_frame(
-                    frame,
-                    known_face_encodings,
-                    face_detector,
-                    shape_predictor,
-                    face_recognition_model,
-                )
-                face_detected = "Unknown" in face_names
-                if face_detected:
-                    if detection_start_time is None:
-                        detection_start_time = time.time()
-                    elif time.time() - detection_start_time >= MIN_TIME_DETECT_DURATION:
-                        buffer_manager.process_detection(True)
-                        detection_start_time = None
-                else:
-                    detection_start_time = None
-        frame_counter += 1
-        time.sleep(0.01)
+                sequence += 1
+                if detection_pool.submit(frame, sequence, timeout=0.05):
+                    frames_in_flight[sequence] = frame
+
+        for result in detection_pool.results(timeout=0.05):
+            detections = dlib.rectangles([dlib.rectangle(*box) for box in result.boxes])
+            # Workers already computed every descriptor, the tracker picks from them
+            tracks = face_tracker.update(
+                detections, lambda index: result.descriptors[index]
+            )
+            scheduler.record_latency(result.latency / detection_pool.workers)
+            frame = frames_in_flight.pop(result.sequence, None)
+            for stale in [seq for seq in frames_in_flight if seq < result.sequence]:
+                del frames_in_flight[stale]  # results arrive in order
+            confirmed = face_tracker.confirmed_unknown()
+            if confirmed and buffer_manager.process_detection(
+                True,
+                frame,
+                [track.location for track in tracks],
+                [track.name for track in tracks],
+            ):
+                face_tracker.mark_reported(confirmed)
+
+        if time.time() - last_stats_time >= DETECTION_STATS_INTERVAL:
+            print_detection_stats(
+                buffer_manager, motion_gate, face_tracker, detection_pool
+            )
+            last_stats_time = time.time()
+    print_detection_stats(buffer_manager, motion_gate, face_tracker, detection_pool)
+
+
+def print_detection_stats(
+    buffer_manager, motion_gate, face_tracker, detection_pool=None
+):
+    print(f"Detection scheduler: {buffer_manager.scheduler.stats()}")
+    print(f"Clip worker: {buffer_manager.clip_worker.stats()}")
+    print(f"Upload spool: {upload_spool.stats()}")
+    if buffer_manager.progressive:
+        print(f"Progressive clips: {buffer_manager.progressive_stats()}")
+    if segment_recorder is not None:
+        print(f"Segment recorder: {segment_recorder.stats()}")
+    if detection_pool is not None:
+        print(
+            f"Detection workers: {detection_pool.workers}, "
+            f"submitted {detection_pool.frames_submitted}, "
+            f"dropped {detection_pool.frames_dropped}, "
+            f"lost to crashes {detection_pool.frames_failed}, "
+            f"restarts {detection_pool.restarts}"
+        )
+    print(f"Motion gate: {motion_gate.stats()}")
+    print(f"Face tracker: {face_tracker.stats()}")
 
 
 # Main control functions
 
 
 def main():
-    global recognition_started, known_face_encodings
-    known_face_encodings = load_encodings()
+    global recognition_started, face_gallery, detection_pool, segment_recorder
+    if DETECTION_WORKERS > 0:
+        # Start the workers before this process loads its own models
+        frame_shape = device_stream.frame_bus.shape if device_stream else FRAME_SHAPE
+        detection_pool = DetectionWorkerPool(
+            DETECTION_WORKERS,
+            frame_shape,
+            SHAPE_PREDICTOR_FILE,
+            FACE_RECOGNITION_MODEL_FILE,
+            detection_scale=DETECTION_SCALE,
+            detection_pyramid=DETECTION_PYRAMID,
+        )
+        print(f"Started {DETECTION_WORKERS} detection worker processes")
+    face_gallery = FaceGallery(load_encodings())
+    # New galleries are swapped into the running detector as they arrive
+    encodings_sync.on_update = face_gallery.rebuild
+    encodings_sync.start()
     face_detector = dlib.get_frontal_face_detector()
     shape_predictor = dlib.shape_predictor(SHAPE_PREDICTOR_FILE)
     face_recognition_model = dlib.face_recognition_model_v1(FACE_RECOGNITION_MODEL_FILE)
@@ -392,22 +691,29 @@ def main():
 
     # Set FPS to a fixed value or determine it dynamically
     fps = 30  # This is an example; adjust based on your camera's capability or streaming configuration
-    n = 10  # Process every 10th frame for face detection
+    n = 10  # Process at most every 10th frame, more when detection is slower
+    clip_worker = ClipWorker(finalize_clip)
+    if BUFFER_MODE == "segments":
+        segment_recorder = SegmentRecorder(
+            RECORDING_DIRECTORY,
+            fps,
+            SEGMENT_SECONDS,
+            segments=int(RECORDING_RING_SECONDS // SEGMENT_SECONDS),
+        )
 
     video_url = f"http://localhost:{PORT}/video_feed"
 
     # chck ofr initial value of RECOGNIZE_FACES and start threads accordingly
     if RECOGNIZE_FACES and not recognition_started:
         print("Starting face recognition")
-        buffer_manager = BufferManager(fps)
+        buffer_manager = BufferManager(fps, clip_worker, detection_stride=n)
         start_threads(
             video_url,
             buffer_manager,
-            known_face_encodings,
+            face_gallery,
             face_detector,
             shape_predictor,
             face_recognition_model,
-            n,
         )
         recognition_started = True
 
@@ -416,15 +722,14 @@ def main():
             condition.wait()  # Wait for notification
             if RECOGNIZE_FACES and not recognition_started:
                 print("Starting face recognition")
-                buffer_manager = BufferManager(fps)
+                buffer_manager = BufferManager(fps, clip_worker, detection_stride=n)
                 start_threads(
                     video_url,
                     buffer_manager,
-                    known_face_encodings,
+                    face_gallery,
                     face_detector,
                     shape_predictor,
                     face_recognition_model,
-                    n,
                 )
                 recognition_started = True
             elif not RECOGNIZE_FACES and recognition_started:
@@ -439,7 +744,7 @@ def main():
     #     target=face_detection_thread,
     #     args=(
     #         buffer_manager,
-    #         known_face_encodings,
+    #         face_gallery,
     #         face_detector,
     #         shape_predictor,
     #         face_recognition_model,
@@ -457,11 +762,10 @@ def main():
 def start_threads(
     video_url,
     buffer_manager,
-    known_face_encodings,
+    face_gallery,
     face_detector,
     shape_predictor,
     face_recognition_model,
-    n,
 ):
     global capture_thread, detection_thread, stop_capture_thread, stop_detection_thread
 
@@ -469,24 +773,34 @@ def start_threads(
     stop_detection_thread = False
 
     if capture_thread is None or not capture_thread.is_alive():
-        capture_thread = threading.Thread(
-            target=frame_capture_thread, args=(video_url, buffer_manager)
-        )
+        if FRAME_SOURCE == "bus" and device_stream is not None:
+            capture_thread = threading.Thread(
+                target=frame_bus_thread, args=(device_stream.frame_bus, buffer_manager)
+            )
+        else:
+            capture_thread = threading.Thread(
+                target=frame_capture_thread, args=(video_url, buffer_manager)
+            )
         capture_thread.daemon = True
         capture_thread.start()
 
     if detection_thread is None or not detection_thread.is_alive():
-        detection_thread = threading.Thread(
-            target=face_detection_thread,
-            args=(
-                buffer_manager,
-                known_face_encodings,
-                face_detector,
-                shape_predictor,
-                face_recognition_model,
-                n,
-            ),
-        )
+        if detection_pool is not None:
+            detection_thread = threading.Thread(
+                target=pooled_detection_thread,
+                args=(buffer_manager, face_gallery, detection_pool),
+            )
+        else:
+            detection_thread = threading.Thread(
+                target=face_detection_thread,
+                args=(
+                    buffer_manager,
+                    face_gallery,
+                    face_detector,
+                    shape_predictor,
+                    face_recognition_model,
+                ),
+            )
         detection_thread.daemon = True
         detection_thread.start()
 
@@ -511,6 +825,10 @@ def stop_threads():
 
 if __name__ == "__main__":
     global user_id, id_token
+    # Flask and the stream server are only needed in the main process
+    import deviceStream
+
+    initialize_firebase()
     try:
         user_id, id_token = authenticate_user(EMAIL, PASSWORD)
         if user_id is None or id_token is None:
@@ -519,13 +837,25 @@ if __name__ == "__main__":
         get_initial_recognize_faces_value()
         setup_firestore_listener(user_id)
 
+        encodings_sync = EncodingsSync(
+            storage.bucket(STORAGE_BUCKET),
+            f"{user_id}/encodings.dat",
+            ENCODINGS_FILE,
+            interval=ENCODINGS_SYNC_INTERVAL,
+        )
+
+        # Resumes uploads left over from a previous run
+        upload_spool = UploadSpool(
+            SPOOL_DIRECTORY,
+            upload_spooled_file,
+            workers=UPLOAD_WORKERS,
+            alert_slo=ALERT_LATENCY_SLO,
+        )
+
         device_stream = deviceStream.DeviceStream(user_id, id_token)
         PORT = device_stream.get_port()
         device_stream.run_server(in_background=True)
 
-        encodings_update_thread = threading.Thread(target=check_for_encodings_update)
-        encodings_update_thread.daemon = True
-        encodings_update_thread.start()
     except Exception as e:
         print(f"An error occurred: {e}")
     try:
@@ -540,3 +870,8 @@ if __name__ == "__main__":
     except Exception as e:
         stop_threads()  # Ensure threads are stopped on exception
         print(f"An error occurred: {e}")
+    finally:
+        if detection_pool is not None:
+            detection_pool.close()  # release the shared-memory frame slots
+        if segment_recorder is not None:
+            segment_recorder.close()  # let ffmpeg finish the open segment
@@ -0,0 +1,147 @@
+SOI = b"\xff\xd8"  # JPEG start of image
+EOI = b"\xff\xd9"  # JPEG end of image
+
+# Parser states
+_SEEK_BOUNDARY = 0
+_READ_HEADERS = 1
+_READ_BODY = 2
+
+
+class MjpegDemuxer:
+    """Incremental demuxer for multipart/x-mixed-replace MJPEG streams.
+
+    Chunks are copied once into a reusable bytearray and scanning resumes where
+    the previous call stopped, so the cost per frame is linear in its size.
+    Frames are yielded as memoryview slices of the internal buffer; a slice is
+    only valid until the next call to feed(), so decode or copy it first.
+    """
+
+    def __init__(self, boundary=b"frame", initial_capacity=256 * 1024):
+        self.boundary = b"--" + boundary
+        self._buffer = bytearray(initial_capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # first byte that has not been consumed yet
+        self._end = 0  # end of valid data in the buffer
+        self._scan = 0  # where the current search resumes
+        self._state = _SEEK_BOUNDARY
+        self._body_start = 0
+        self._content_length = None
+
+        self.bytes_fed = 0
+        self.frames = 0
+
+    def feed(self, chunk):
+        """Append a chunk from the stream and yield every completed JPEG frame."""
+        self._append(chunk)
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return
+            self.frames += 1
+            yield frame
+
+    def reset(self):
+        """Drop any partial data, e.g. after reconnecting to the stream."""
+        self._start = self._end = self._scan = 0
+        self._state = _SEEK_BOUNDARY
+        self._content_length = None
+
+    def _append(self, chunk):
+        size = len(chunk)
+        self.bytes_fed += size
+        if self._start == self._end:
+            # Everything was consumed, rewind for free instead of compacting
+            self._scan -= self._start
+            self._body_start -= self._start
+            self._start = self._end = 0
+
+        if self._end + size > len(self._buffer):
+            self._make_room(size)
+
+        self._view[self._end : self._end + size] = chunk
+        self._end += size
+
+    def _make_room(self, size):
+        pending = self._end - self._start
+        needed = pending + size
+        if needed > len(self._buffer):
+            # Rebind to a bigger buffer; the old one may still be exported
+            capacity = len(self._buffer)
+            while capacity < needed:
+                capacity *= 2
+            buffer = bytearray(capacity)
+            buffer[:pending] = self._view[self._start : self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        elif pending:
+            # Same-size slice assignment never resizes, so it is allowed while
+            # views are exported. Copy first when the two ranges overlap.
+            data = self._view[self._start : self._end]
+            if pending > self._start:
+                data = data.tobytes()
+            self._view[:pending] = data
+
+        self._scan -= self._start
+        self._body_start -= self._start
+        self._start = 0
+        self._end = pending
+
+    def _find(self, needle, start):
+        return self._buffer.find(needle, start, self._end)
+
+    def _next_frame(self):
+        while True:
+            if self._state == _SEEK_BOUNDARY:
+                index = self._find(self.boundary, self._scan)
+                if index == -1:
+                    # Keep a tail in case the boundary is split across chunks
+                    self._scan = max(self._start, self._end - len(self.boundary) + 1)
+                    self._start = self._scan
+                    return None
+                self._start = index
+                self._scan = index + len(self.boundary)
+                self._state = _READ_HEADERS
+
+            elif self._state == _READ_HEADERS:
+                index = self._find(b"\r\n\r\n", self._scan)
+                if index == -1:
+                    self._scan = max(self._scan, self._end - 3)
+                    return None
+                self._content_length = self._parse_content_length(
+                    self._buffer[self._start : index]
+                )
+                self._body_start = index + 4
+                self._scan = self._body_start
+                self._state = _READ_BODY
+
+            else:
+                end = self._body_end()
+                if end is None:
+                    return None
+                frame = self._view[self._body_start : end]
+                self._start = self._scan = end
+                self._state = _SEEK_BOUNDARY
+                return frame
+
+    def _body_end(self):
+        if self._content_length is not None:
+            end = self._body_start + self._content_length
+            return end if end <= self._end else None
+
+        # No length header: the frame ends at the JPEG end-of-image marker
+        index = self._find(EOI, self._scan)
+        if index == -1:
+            self._scan = max(self._body_start, self._end - 1)
+            return None
+        return index + 2
+
+    @staticmethod
+    def _parse_content_length(headers):
+        for line in bytes(headers).split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    return None
+        return None
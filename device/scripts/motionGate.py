@@ -0,0 +1,105 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap motion check that decides whether face detection is worth running.
+
+    Frames are downscaled to a small grayscale image and compared with a
+    running-average background model. Detection is allowed while motion is
+    seen and for `cooldown` seconds afterwards, so a person who stops moving
+    in front of the camera is still recognised.
+    """
+
+    def __init__(
+        self,
+        sensitivity=0.005,
+        pixel_threshold=25,
+        cooldown=5.0,
+        width=160,
+        learning_rate=0.05,
+        region=None,
+    ):
+        # Fraction of changed pixels that counts as motion
+        self.sensitivity = sensitivity
+        # Per-pixel change that counts as changed
+        self.pixel_threshold = pixel_threshold
+        self.cooldown = cooldown
+        self.width = width
+        self.learning_rate = learning_rate
+        # Optional (left, top, right, bottom) fractions of the frame to watch
+        self.region = region
+
+        self.background = None
+        self.last_motion_time = None
+        self.motion_region = None  # (left, top, right, bottom) in frame coordinates
+
+        self.frames_checked = 0
+        self.detections_allowed = 0
+        self.detections_skipped = 0
+
+    def should_detect(self, frame):
+        """Update the background model with frame and report whether to detect."""
+        self.frames_checked += 1
+        now = time.time()
+        if self.detect_motion(frame):
+            self.last_motion_time = now
+
+        if (
+            self.last_motion_time is not None
+            and now - self.last_motion_time < self.cooldown
+        ):
+            self.detections_allowed += 1
+            return True
+        self.detections_skipped += 1
+        return False
+
+    def detect_motion(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.width / width
+        small = cv2.resize(frame, (self.width, max(1, int(height * scale))))
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return True  # no model yet, let the detector see the first frame
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        mask = diff > self.pixel_threshold
+        if self.region is not None:
+            rows, cols = mask.shape
+            left, top, right, bottom = self.region
+            region_mask = np.zeros_like(mask)
+            region_mask[
+                int(top * rows) : int(bottom * rows),
+                int(left * cols) : int(right * cols),
+            ] = True
+            mask &= region_mask
+            if mask.sum() < self.sensitivity * region_mask.sum():
+                return False
+        elif mask.mean() < self.sensitivity:
+            return False
+
+        x, y, w, h = cv2.boundingRect(mask.astype(np.uint8))
+        self.motion_region = (
+            int(x / scale),
+            int(y / scale),
+            int((x + w) / scale),
+            int((y + h) / scale),
+        )
+        return True
+
+    def reset(self):
+        self.background = None
+        self.last_motion_time = None
+        self.motion_region = None
+
+    def stats(self):
+        return {
+            "frames_checked": self.frames_checked,
+            "detections_allowed": self.detections_allowed,
+            "detections_skipped": self.detections_skipped,
+        }
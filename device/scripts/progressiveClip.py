@@ -0,0 +1,244 @@
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+
+from clipWriter import CLIP_BITRATE, FFMPEG_BINARY, frame_bytes, input_args, output_args
+
+FRAGMENT_SECONDS = 2  # a new fragment, and so a new upload, every 2 seconds
+
+
+def complete_fragments_end(f, offset, size):
+    """Return the end of the last complete moov or mdat box after offset.
+
+    A fragmented MP4 is a sequence of top-level boxes (ftyp, moov, then
+    moof + mdat pairs). Everything up to the end of a finished mdat, or of
+    the moov for the header, can be uploaded and played on its own.
+    """
+    end = offset
+    position = offset
+    while position + 8 <= size:
+        f.seek(position)
+        box_size, box_type = struct.unpack(">I4s", f.read(8))
+        if box_size == 1:
+            if position + 16 > size:
+                break
+            (box_size,) = struct.unpack(">Q", f.read(8))
+        elif box_size == 0:
+            break  # box runs to the end of the file, still being written
+        if box_size < 8 or position + box_size > size:
+            break
+        position += box_size
+        if box_type in (b"moov", b"mdat"):
+            end = position
+    return end
+
+
+class ProgressiveClip:
+    """Encode an event as fragmented MP4 and upload it while it is recorded.
+
+    Frames go to ffmpeg through a writer thread; an uploader thread watches
+    the growing file and sends each newly completed fragment as the next
+    numbered piece, so the server can serve the clip before the event ends.
+    upload(index, data, final) -> bool is retried with a growing delay. If a
+    piece still fails, encoding carries on and on_failed(path) receives the
+    finished file, so it can be uploaded as a whole clip instead.
+
+    The pre-roll frames are encoded first, then live frames from a queue of
+    at most max_pending frames, sized by the caller to hold the post-roll;
+    the same frames are kept in the frame ring anyway. Frames beyond it are
+    dropped rather than blocking the capture thread. ffmpeg is started on
+    the writer thread, so neither write() nor finish() ever waits on it.
+    """
+
+    def __init__(
+        self,
+        path,
+        fps,
+        upload,
+        preroll=(),
+        on_failed=None,
+        bitrate=CLIP_BITRATE,
+        poll_interval=0.5,
+        retry_interval=2.0,
+        max_retries=10,
+        max_pending=450,
+    ):
+        self.path = path
+        self.fps = fps
+        self.upload = upload
+        self.on_failed = on_failed
+        self._preroll = list(preroll)
+        self.bitrate = bitrate
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._process = None
+        self._writer = None
+        self._uploader = None
+        self._finished = threading.Event()
+        self._closing = threading.Event()
+
+        self.started = time.time()
+        self.pieces_uploaded = 0
+        self.bytes_uploaded = 0
+        self.first_upload_seconds = None
+        self.failed = False
+        self.frames_dropped = 0
+
+    def write(self, frame):
+        """Queue a live frame for the encoder without ever blocking the caller."""
+        if self._writer is None:
+            self._start(self._preroll[0] if self._preroll else frame)
+        if self._closing.is_set():
+            return
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def finish(self):
+        """Stop accepting frames; the rest is encoded and uploaded in the background."""
+        if self._writer is None:
+            if not self._preroll:
+                self._finished.set()  # no frame was ever written
+                return
+            self._start(self._preroll[0])
+        self._closing.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass  # the writer stops on _closing once the queue is drained
+
+    def wait(self, timeout=None):
+        """Block until the final piece was uploaded or the upload gave up."""
+        return self._finished.wait(timeout)
+
+    def _start(self, first_frame):
+        self._writer = threading.Thread(target=self._write_frames, args=(first_frame,))
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _launch(self, first_frame):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        command = (
+            [FFMPEG_BINARY, "-y", "-loglevel", "error"]
+            + input_args(first_frame, self.fps)
+            + output_args(self.bitrate)
+            + [
+                "-force_key_frames",
+                f"expr:gte(t,n_forced*{FRAGMENT_SECONDS})",
+                # Header first, then one self-contained fragment per keyframe
+                "-movflags",
+                "empty_moov+frag_keyframe+default_base_moof",
+                "-f",
+                "mp4",
+                self.path,
+            ]
+        )
+        try:
+            self._process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL
+            )
+        except OSError as e:
+            print(f"Progressive clip: could not start ffmpeg for {self.path}: {e}")
+            return False
+        self._uploader = threading.Thread(target=self._upload_fragments)
+        self._uploader.daemon = True
+        self._uploader.start()
+        return True
+
+    def _encode(self, frame):
+        try:
+            self._process.stdin.write(frame_bytes(frame))
+            return True
+        except (BrokenPipeError, ValueError):
+            print(f"Progressive clip: ffmpeg exited early for {self.path}")
+            return False
+
+    def _next_frame(self):
+        """Next live frame, or None once finish() was called and all are read."""
+        while True:
+            try:
+                return self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self._closing.is_set():
+                    return None
+
+    def _write_frames(self, first_frame):
+        running = self._launch(first_frame)
+        preroll, self._preroll = self._preroll, []
+        running = running and all(self._encode(frame) for frame in preroll)
+        del preroll
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            # After a failure keep draining, so the queue never fills up
+            if running:
+                running = self._encode(frame)
+        if self._process is None:
+            self.failed = True
+            self._finished.set()
+            return
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._process.wait()
+
+    def _upload_fragments(self):
+        offset = 0
+        index = 0
+        try:
+            while True:
+                encoding_done = self._process.poll() is not None
+                size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                data = None
+                if size > offset:
+                    with open(self.path, "rb") as f:
+                        if encoding_done:
+                            end = size  # ffmpeg is done, send whatever is left
+                        else:
+                            end = complete_fragments_end(f, offset, size)
+                        if end > offset:
+                            f.seek(offset)
+                            data = f.read(end - offset)
+
+                if data is not None or encoding_done:
+                    if not self._send(index, data or b"", encoding_done):
+                        self.failed = True
+                        # Let the whole event reach the file, then hand it over
+                        self._process.wait()
+                        if self.on_failed is not None and os.path.exists(self.path):
+                            self.on_failed(self.path)
+                        return
+                    offset += len(data or b"")
+                    index += 1
+                if encoding_done:
+                    print(
+                        f"Progressive clip {self.path}: {self.pieces_uploaded} pieces, "
+                        f"first playable after {self.first_upload_seconds}s, "
+                        f"{self.frames_dropped} frames dropped"
+                    )
+                    if os.path.exists(self.path):
+                        os.remove(self.path)  # everything is on the server now
+                    return
+                time.sleep(self.poll_interval)
+        finally:
+            self._finished.set()
+
+    def _send(self, index, data, final):
+        for attempt in range(self.max_retries):
+            if self.upload(index, data, final):
+                if self.first_upload_seconds is None:
+                    self.first_upload_seconds = round(time.time() - self.started, 2)
+                self.pieces_uploaded += 1
+                self.bytes_uploaded += len(data)
+                return True
+            time.sleep(self.retry_interval * (attempt + 1))
+        print(f"Progressive clip: giving up on piece {index} of {self.path}")
+        return False
@@ -0,0 +1,222 @@
+import glob
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+
+from clipWriter import (
+    CLIP_BITRATE,
+    FFMPEG_BINARY,
+    StderrTail,
+    frame_bytes,
+    input_args,
+    output_args,
+)
+
+
+class SegmentRecorder:
+    """Continuous recording into a fixed-size ring of short segments on disk.
+
+    One long-lived ffmpeg process encodes every frame and writes MPEG-TS
+    segments of `segment_seconds` each; the segment muxer wraps around after
+    `segments` files and overwrites them in place. Event clips are assembled
+    by concatenating the segments that cover the event, without re-encoding.
+    The process is owned by a recorder thread, which restarts it after
+    restart_delay seconds if it exits; frames arriving meanwhile are dropped.
+    """
+
+    def __init__(
+        self,
+        directory,
+        fps,
+        segment_seconds=4,
+        segments=75,
+        bitrate=CLIP_BITRATE,
+        max_pending=60,
+        restart_delay=5.0,
+    ):
+        self.directory = directory
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.segments = segments
+        self.bitrate = bitrate
+        self.restart_delay = restart_delay
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._process = None
+        self._thread = None
+        self._closing = threading.Event()
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.restarts = 0
+
+    @property
+    def ring_seconds(self):
+        return self.segment_seconds * self.segments
+
+    def write(self, frame):
+        """Queue a frame for the encoder without ever blocking the caller."""
+        if self._thread is None:
+            # ffmpeg is started on the recorder thread, not the capture thread
+            self._thread = threading.Thread(target=self._run, args=(frame,))
+            self._thread.daemon = True
+            self._thread.start()
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def stats(self):
+        return {
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "restarts": self.restarts,
+        }
+
+    def _launch(self, first_frame):
+        os.makedirs(self.directory, exist_ok=True)
+        command = (
+            [FFMPEG_BINARY, "-y", "-loglevel", "error"]
+            + input_args(first_frame, self.fps)
+            + output_args(self.bitrate)
+            + [
+                # Keyframe at every boundary so segments can be cut and joined
+                "-force_key_frames",
+                f"expr:gte(t,n_forced*{self.segment_seconds})",
+                "-f",
+                "segment",
+                "-segment_time",
+                str(self.segment_seconds),
+                "-segment_wrap",
+                str(self.segments),
+                "-segment_format",
+                "mpegts",
+                "-reset_timestamps",
+                "1",
+                os.path.join(self.directory, "segment_%03d.ts"),
+            ]
+        )
+        try:
+            self._process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            print(f"Segment recorder: could not start ffmpeg: {e}")
+            return None
+        return StderrTail(self._process.stderr)
+
+    def _next_frame(self):
+        """Next frame, or None once close() was called and the queue is drained."""
+        while True:
+            try:
+                return self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closing.is_set():
+                    return None
+
+    def _run(self, first_frame):
+        while not self._closing.is_set():
+            error = self._launch(first_frame)
+            stopped = False
+            while error is not None:
+                frame = self._next_frame()
+                if frame is None:
+                    stopped = True
+                    break
+                try:
+                    self._process.stdin.write(frame_bytes(frame))
+                    self.frames_written += 1
+                except (BrokenPipeError, ValueError):
+                    break
+            if error is not None:
+                try:
+                    self._process.stdin.close()
+                except OSError:
+                    pass
+                self._process.wait()
+            if stopped:
+                return
+            print(
+                f"Segment recorder: ffmpeg exited ({error.text() if error else ''}), "
+                f"restarting in {self.restart_delay}s"
+            )
+            self._closing.wait(self.restart_delay)
+            self.restarts += 1
+
+    def close(self):
+        if self._thread is not None:
+            self._closing.set()
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass  # the recorder stops on _closing once the queue is drained
+            self._thread.join(timeout=10)
+
+    def segments_between(self, start_time, end_time):
+        """Return the finished segment files that overlap [start_time, end_time].
+
+        A segment covers the time from the previous segment's last write to
+        its own, so segments are ordered and located by modification time.
+        """
+        paths = glob.glob(os.path.join(self.directory, "segment_*.ts"))
+        timed = sorted((os.path.getmtime(path), path) for path in paths)
+        selected = []
+        previous_end = 0
+        for modified, path in timed:
+            segment_start = previous_end or modified - self.segment_seconds
+            if modified >= start_time and segment_start <= end_time:
+                selected.append(path)
+            previous_end = modified
+        return selected
+
+    def assemble_clip(self, start_time, end_time, path):
+        """Join the segments covering an event into an MP4 without re-encoding."""
+        # Wait for the segment holding end_time to be closed
+        wait = end_time + self.segment_seconds - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+        segments = self.segments_between(start_time, end_time)
+        if not segments:
+            print("No recorded segments cover this event")
+            return None
+
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".txt", dir=self.directory, delete=False
+        ) as playlist:
+            for segment in segments:
+                playlist.write(f"file '{os.path.abspath(segment)}'\n")
+        tmp_path = path + ".tmp.mp4"
+        command = [
+            FFMPEG_BINARY,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            playlist.name,
+            "-c",
+            "copy",
+            "-movflags",
+            "+faststart",
+            tmp_path,
+        ]
+        result = subprocess.run(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        os.remove(playlist.name)
+        if result.returncode != 0:
+            print(
+                f"ffmpeg concat failed: {result.stderr.decode(errors='replace').strip()}"
+            )
+            return None
+        os.replace(tmp_path, path)
+        return path
@@ -5,17 +5,24 @@ import os
 import uuid
 import time
 
+SERVER_URL = "http://localhost:3000"  # Modify with the actual URL of your server
+CHUNK_SIZE = 1024 * 1024  # bytes per request for chunked uploads
 
-def sendFile(file_path, device_id, device_location, token, event_id):
-    url = "http://localhost:3000/upload"  # Modify with the actual URL of your server endpoint
+# One pooled keep-alive session so uploads reuse their TCP connections
+session = requests.Session()
 
+
+def guess_mime_type(file_path):
     # Guess the MIME type of the file based on its extension
     mime_type, _ = mimetypes.guess_type(file_path)
     if mime_type is None:
         mime_type = "application/octet-stream"  # Default MIME type if unknown
+    return mime_type
+
 
+def build_headers(device_id, device_location, token, event_id):
     # Prepare headers with the authentication and additional metadata
-    headers = {
+    return {
         "authorization": f"Bearer {token}",
         "deviceID": device_id,
         "deviceLocation": device_location,
@@ -23,23 +30,144 @@ def sendFile(file_path, device_id, device_location, token, event_id):
         "eventID": event_id,
     }
 
+
+def sendFile(file_path, device_id, device_location, token, event_id, timeout=60):
+    """Upload a file to the server, returns True once the server accepted it."""
+    url = f"{SERVER_URL}/upload"
+    mime_type = guess_mime_type(file_path)
+    headers = build_headers(device_id, device_location, token, event_id)
+
     # Prepare the files dictionary for multipart encoding
-    with open(file_path, "rb") as f:
-        files = {
-            "file": (os.path.basename(file_path), f, mime_type),
-        }
-
-        # POST request to upload the file
-        response = requests.post(url, files=files, headers=headers)
-
-        # Check the response status and handle accordingly
-        if response.status_code == 200:
-            print(f"File uploaded successfully! Response: {response.text}")
-        else:
-            print(
-                f"Failed to upload file. Status: {response.status_code}, Response: {response.text}"
+    try:
+        with open(file_path, "rb") as f:
+            files = {
+                "file": (os.path.basename(file_path), f, mime_type),
+            }
+
+            # POST request to upload the file
+            response = session.post(url, files=files, headers=headers, timeout=timeout)
+    except (OSError, requests.RequestException) as e:
+        print(f"Failed to upload file {file_path}: {e}")
+        return False
+
+    # Check the response status and handle accordingly
+    if response.status_code == 200:
+        print(f"File uploaded successfully! Response: {response.text}")
+        return True
+    print(
+        f"Failed to upload file. Status: {response.status_code}, Response: {response.text}"
+    )
+    return False
+
+
+def sendFileChunked(file_path, device_id, device_location, token, event_id, timeout=60):
+    """Upload a file in chunks, resuming where a previous attempt stopped.
+
+    The upload id is kept next to the file in a ".upload" marker, so a retry
+    after a dropped connection or a restart continues from the offset the
+    server reports instead of sending the whole file again.
+    """
+    url = f"{SERVER_URL}/upload/sessions"
+    headers = build_headers(device_id, device_location, token, event_id)
+    marker_path = file_path + ".upload"
+
+    try:
+        size = os.path.getsize(file_path)
+        upload_id, offset, complete = None, 0, False
+        if os.path.exists(marker_path):
+            with open(marker_path) as marker:
+                upload_id = marker.read().strip()
+            response = session.get(
+                f"{url}/{upload_id}", headers=headers, timeout=timeout
+            )
+            if response.status_code == 200:
+                offset = response.json()["offset"]
+                complete = response.json().get("complete", False)
+            elif response.status_code == 404:
+                upload_id = None  # expired or unknown, start over
+            else:
+                print(
+                    f"Failed to resume upload. Status: {response.status_code}, Response: {response.text}"
+                )
+                return False
+
+        if upload_id is None:
+            response = session.post(
+                url,
+                json={
+                    "fileName": os.path.basename(file_path),
+                    "size": size,
+                    "mimetype": guess_mime_type(file_path),
+                },
+                headers=headers,
+                timeout=timeout,
             )
+            if response.status_code != 201:
+                print(
+                    f"Failed to start upload. Status: {response.status_code}, Response: {response.text}"
+                )
+                return False
+            upload_id = response.json()["uploadId"]
+            with open(marker_path, "w") as marker:
+                marker.write(upload_id)
+
+        conflicts = 0
+        with open(file_path, "rb") as f:
+            # Only a response with complete set means the clip reached Storage;
+            # once offset == size the empty chunk asks the server to finish it
+            while not complete:
+                f.seek(offset)
+                chunk = f.read(CHUNK_SIZE)
+                response = session.put(
+                    f"{url}/{upload_id}",
+                    data=chunk,
+                    headers={
+                        **headers,
+                        "Content-Type": "application/octet-stream",
+                        "Upload-Offset": str(offset),
+                    },
+                    timeout=timeout,
+                )
+                conflicts = conflicts + 1 if response.status_code == 409 else 0
+                if response.status_code not in (200, 409) or conflicts > 3:
+                    print(
+                        f"Failed to upload chunk. Status: {response.status_code}, Response: {response.text}"
+                    )
+                    return False
+                # On 409 the server tells us which offset it expects instead
+                offset = response.json()["offset"]
+                complete = response.json().get("complete", False)
+    except (OSError, ValueError, requests.RequestException) as e:
+        print(f"Failed to upload file {file_path}: {e}")
+        return False
+
+    os.remove(marker_path)
+    print(f"File uploaded successfully in chunks: {os.path.basename(file_path)}")
+    return True
+
+
+def sendSegment(
+    data, index, final, device_id, device_location, token, event_id, timeout=60
+):
+    """Upload one piece of a progressive clip, returns True once it is stored."""
+    url = f"{SERVER_URL}/upload/segments/{event_id}/{index}"
+    headers = build_headers(device_id, device_location, token, event_id)
+    headers["Content-Type"] = "video/mp4"
+    if final:
+        headers["Upload-Final"] = "1"
+
+    try:
+        response = session.put(url, data=data, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Failed to upload segment {index} of {event_id}: {e}")
+        return False
 
+    if response.status_code == 200:
+        return True
+    print(
+        f"Failed to upload segment. Status: {response.status_code}, Response: {response.text}"
+    )
+    return False
 
 
 # sendFile(
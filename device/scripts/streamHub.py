@@ -0,0 +1,101 @@
+import threading
+
+import cv2
+
+
+class JpegBroadcastHub:
+    """Encode each camera frame once and share it with every /video_feed viewer.
+
+    A single encoder thread follows the frame bus while at least one viewer is
+    connected and keeps the newest multipart chunk in a shared slot. Viewers
+    always take the newest chunk, so a slow client drops frames instead of
+    delaying the encoder or the other clients.
+    """
+
+    def __init__(self, frame_bus, quality=95):
+        self.frame_bus = frame_bus
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self._condition = threading.Condition()
+        self._chunk = None
+        self._sequence = 0
+        self._viewers = 0
+        self._thread = None
+
+        self.frames_encoded = 0
+
+    @property
+    def viewers(self):
+        return self._viewers
+
+    def frames(self):
+        """Generator of multipart chunks for one HTTP client."""
+        sequence = self._add_viewer()
+        try:
+            while True:
+                sequence, chunk = self.wait_for_chunk(sequence)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self._remove_viewer()
+
+    def wait_for_chunk(self, last_sequence, timeout=None):
+        """Return (sequence, chunk) for the newest chunk after last_sequence."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._sequence > last_sequence or self.frame_bus.closed,
+                timeout,
+            )
+            if self._sequence <= last_sequence:
+                return last_sequence, None
+            return self._sequence, self._chunk
+
+    def _add_viewer(self):
+        """Register a viewer and return the sequence it should wait after."""
+        with self._condition:
+            self._viewers += 1
+            if self._thread is not None and self._thread.is_alive():
+                return 0
+            # The shared chunk is stale, wait for the restarted encoder
+            self._thread = threading.Thread(target=self._encode_frames)
+            self._thread.daemon = True
+            self._thread.start()
+            return self._sequence
+
+    def _remove_viewer(self):
+        with self._condition:
+            self._viewers -= 1
+
+    def _encode_frames(self):
+        sequence = self.frame_bus.sequence
+        while True:
+            with self._condition:
+                if self._viewers == 0:
+                    # Nobody is watching, stop encoding until the next viewer
+                    self._thread = None
+                    return
+            sequence, frame = self.frame_bus.wait_for_frame(
+                sequence, timeout=1, latest=True
+            )
+            if frame is None:
+                if self.frame_bus.closed:
+                    with self._condition:
+                        self._thread = None
+                        self._condition.notify_all()
+                    return
+                continue
+
+            ret, buffer = cv2.imencode(".jpg", frame, self.encode_params)
+            if not ret:
+                continue
+            frame = buffer.tobytes()
+            chunk = (
+                b"--frame\r\n"
+                b"Content-Type: image/jpeg\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(frame) + frame + b"\r\n"
+            )
+            with self._condition:
+                self._chunk = chunk
+                self._sequence = sequence
+                self.frames_encoded += 1
+                self._condition.notify_all()
@@ -0,0 +1,241 @@
+import heapq
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class SpoolItem:
+    def __init__(self, item_id, path, event_id, created, attempts=0, detected_at=None):
+        self.item_id = item_id
+        self.path = path
+        self.event_id = event_id
+        self.created = created
+        self.attempts = attempts
+        self.detected_at = detected_at  # set for alert snapshots
+
+    def to_record(self):
+        return {
+            "op": "add",
+            "id": self.item_id,
+            "path": self.path,
+            "event_id": self.event_id,
+            "created": self.created,
+            "detected_at": self.detected_at,
+        }
+
+
+class UploadSpool:
+    """Durable upload queue in front of sendFile.
+
+    Files are moved into a spool directory and recorded in an append-only
+    journal before enqueue() returns, so pending uploads survive a crash or
+    restart. A fixed number of uploader threads (the concurrency cap) retry
+    failed uploads with exponential backoff; files are deleted from the spool
+    once the server accepted them.
+
+    Alert snapshots are enqueued with the time the event was detected; they
+    jump ahead of queued clips and their detection-to-acknowledgement latency
+    is tracked against alert_slo seconds.
+    """
+
+    def __init__(
+        self,
+        directory,
+        upload,
+        workers=2,
+        base_backoff=2.0,
+        max_backoff=300.0,
+        alert_slo=10.0,
+    ):
+        self.directory = directory
+        self.upload = upload  # upload(item) -> bool
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.alert_slo = alert_slo
+        self.journal_path = os.path.join(directory, "journal.jsonl")
+
+        self._condition = threading.Condition()
+        self._ready = []  # heap of (next_attempt, sequence, item)
+        self._sequence = 0
+        self._pending = {}
+        self._in_progress = 0
+        self._latencies = deque(maxlen=200)
+        self._alert_latencies = deque(maxlen=200)
+
+        self.uploaded = 0
+        self.failed_attempts = 0
+        self.alerts_over_slo = 0
+
+        os.makedirs(directory, exist_ok=True)
+        with self._condition:
+            for item in self._recover():
+                self._schedule(item, self._first_attempt_time(item))
+        self._journal = open(self.journal_path, "a")
+
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, file_path, event_id, detected_at=None):
+        """Move file_path into the spool and schedule its upload.
+
+        Passing detected_at marks the file as an alert snapshot.
+        """
+        item_id = uuid.uuid4().hex
+        # One directory per item keeps the file name the server will see
+        item_directory = os.path.join(self.directory, item_id)
+        os.makedirs(item_directory, exist_ok=True)
+        spooled_path = os.path.join(item_directory, os.path.basename(file_path))
+        os.replace(file_path, spooled_path)
+        item = SpoolItem(
+            item_id, spooled_path, event_id, time.time(), detected_at=detected_at
+        )
+        with self._condition:
+            self._write_journal(item.to_record())
+            self._schedule(item, self._first_attempt_time(item))
+        return item_id
+
+    def stats(self):
+        with self._condition:
+            latencies = sorted(self._latencies)
+            alert_latencies = sorted(self._alert_latencies)
+            spool_bytes = 0
+            for item in self._pending.values():
+                try:
+                    spool_bytes += os.path.getsize(item.path)
+                except OSError:
+                    pass
+            return {
+                "pending": len(self._pending),
+                "in_progress": self._in_progress,
+                "spool_bytes": spool_bytes,
+                "uploaded": self.uploaded,
+                "failed_attempts": self.failed_attempts,
+                "latency_p50": _percentile(latencies, 0.5),
+                "latency_p95": _percentile(latencies, 0.95),
+                "alert_latency_p50": _percentile(alert_latencies, 0.5),
+                "alert_latency_p95": _percentile(alert_latencies, 0.95),
+                "alerts_over_slo": self.alerts_over_slo,
+            }
+
+    def _recover(self):
+        """Replay the journal, keep items whose file is still spooled."""
+        items = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    if record["op"] == "add":
+                        items[record["id"]] = SpoolItem(
+                            record["id"],
+                            record["path"],
+                            record["event_id"],
+                            record["created"],
+                            detected_at=record.get("detected_at"),
+                        )
+                    elif record["op"] == "done":
+                        items.pop(record["id"], None)
+        items = {
+            item_id: item
+            for item_id, item in items.items()
+            if os.path.exists(item.path)
+        }
+
+        # Compact the journal down to the items that are still pending
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w") as journal:
+            for item in items.values():
+                journal.write(json.dumps(item.to_record()) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+        if items:
+            print(f"Resuming {len(items)} pending uploads from {self.directory}")
+        return items.values()
+
+    def _write_journal(self, record):
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _first_attempt_time(self, item):
+        # The detection time is in the past, so alerts sort ahead of waiting clips
+        if item.detected_at is not None:
+            return min(item.detected_at, time.time())
+        return time.time()
+
+    def _schedule(self, item, when):
+        self._pending[item.item_id] = item
+        self._sequence += 1
+        heapq.heappush(self._ready, (when, self._sequence, item))
+        self._condition.notify()
+
+    def _next_item(self):
+        with self._condition:
+            while True:
+                if self._ready:
+                    delay = self._ready[0][0] - time.time()
+                    if delay <= 0:
+                        self._in_progress += 1
+                        return heapq.heappop(self._ready)[2]
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            item = self._next_item()
+            try:
+                succeeded = self.upload(item)
+            except Exception as e:
+                print(f"Error uploading {item.path}: {e}")
+                succeeded = False
+
+            with self._condition:
+                self._in_progress -= 1
+                if succeeded:
+                    self._write_journal({"op": "done", "id": item.item_id})
+                    del self._pending[item.item_id]
+                    if not self._pending:
+                        self._journal.truncate(0)  # nothing left to recover
+                    self.uploaded += 1
+                    # Latency from enqueue to the server's acknowledgement
+                    self._latencies.append(time.time() - item.created)
+                    if item.detected_at is not None:
+                        alert_latency = time.time() - item.detected_at
+                        self._alert_latencies.append(alert_latency)
+                        if alert_latency > self.alert_slo:
+                            self.alerts_over_slo += 1
+                else:
+                    self.failed_attempts += 1
+                    item.attempts += 1
+                    backoff = min(
+                        self.max_backoff, self.base_backoff * 2 ** (item.attempts - 1)
+                    )
+                    # Jitter keeps several devices from retrying in lockstep
+                    backoff *= random.uniform(0.5, 1.0)
+                    self._schedule(item, time.time() + backoff)
+
+            if succeeded:
+                try:
+                    os.remove(item.path)
+                    os.rmdir(os.path.dirname(item.path))
+                except OSError:
+                    pass
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
@@ -0,0 +1,293 @@
+// routes/chunkedUploadRoute.js
+// Resumable uploads: chunks are appended to a temp file at explicit offsets and
+// the finished file is streamed to Storage, so memory use does not grow with
+// the size of the clip.
+const express = require("express");
+const crypto = require("crypto");
+const fs = require("fs");
+const os = require("os");
+const path = require("path");
+const { Transform } = require("stream");
+const { pipeline } = require("stream/promises");
+const { admin, db } = require("../config/firebase");
+const saveFileMetadata = require("../utils/saveFileMetadata");
+
+const router = express.Router();
+
+const UPLOAD_DIR =
+  process.env.UPLOAD_TMP_DIR || path.join(os.tmpdir(), "guardian-eye-uploads");
+fs.mkdirSync(UPLOAD_DIR, { recursive: true });
+
+// Sessions untouched for this long are removed with their data, in hours
+const SESSION_TTL =
+  Number(process.env.UPLOAD_SESSION_TTL_HOURS ?? 24) * 60 * 60 * 1000;
+const SWEEP_INTERVAL = 60 * 60 * 1000; // ms between expiry sweeps
+
+// Uploads that currently have a chunk in flight
+const busy = new Set();
+
+const dataPath = (id) => path.join(UPLOAD_DIR, `${id}.part`);
+const sessionPath = (id) => path.join(UPLOAD_DIR, `${id}.json`);
+
+// Remove expired sessions, and data or temp files whose session is gone.
+// Every chunk rewrites the session file, so its mtime is the last activity.
+async function sweepSessions() {
+  const now = Date.now();
+  let names;
+  try {
+    names = await fs.promises.readdir(UPLOAD_DIR);
+  } catch (error) {
+    console.error("Upload sweep failed:", error.message);
+    return;
+  }
+  for (const name of names) {
+    const id = name.split(".")[0];
+    if (busy.has(id)) {
+      continue;
+    }
+    const filePath = path.join(UPLOAD_DIR, name);
+    try {
+      if (name.endsWith(".part") && names.includes(`${id}.json`)) {
+        continue; // expires together with its session
+      }
+      const { mtimeMs } = await fs.promises.stat(filePath);
+      if (now - mtimeMs < SESSION_TTL) {
+        continue;
+      }
+      await fs.promises.rm(filePath, { force: true });
+      if (name.endsWith(".json")) {
+        await fs.promises.rm(dataPath(id), { force: true });
+      }
+    } catch (error) {
+      console.error(`Upload sweep failed for ${name}:`, error.message);
+    }
+  }
+}
+
+sweepSessions();
+setInterval(sweepSessions, SWEEP_INTERVAL).unref();
+
+// Fails the stream once it carries more than limit bytes
+function limitBytes(limit) {
+  let received = 0;
+  return new Transform({
+    transform(chunk, encoding, callback) {
+      received += chunk.length;
+      if (received > limit) {
+        return callback(new Error("Chunk overruns the upload size"));
+      }
+      callback(null, chunk);
+    },
+  });
+}
+
+async function loadSession(id, uid) {
+  if (!/^[a-f0-9]{32}$/.test(id)) {
+    return null;
+  }
+  try {
+    const session = JSON.parse(await fs.promises.readFile(sessionPath(id)));
+    return session.uid === uid ? session : null;
+  } catch (error) {
+    return null;
+  }
+}
+
+async function saveSession(session) {
+  // Write then rename so a crash never leaves a half-written session file
+  const tmpPath = `${sessionPath(session.id)}.tmp`;
+  await fs.promises.writeFile(tmpPath, JSON.stringify(session));
+  await fs.promises.rename(tmpPath, sessionPath(session.id));
+}
+
+// A device whose progressive upload gave up sends the whole clip instead;
+// it takes over the event's document and the partial pieces are dropped
+async function replaceProgressive(session) {
+  if (!session.eventID || !/^[A-Za-z0-9_]+$/.test(session.eventID)) {
+    return null;
+  }
+  const docRef = db
+    .collection("users")
+    .doc(session.uid)
+    .collection("videos")
+    .doc(session.eventID);
+  const doc = await docRef.get();
+  if (!doc.exists || !doc.data().progressive) {
+    return null;
+  }
+  await docRef.set(
+    { progressive: false, complete: true, fileName: session.fileName },
+    { merge: true }
+  );
+  await admin
+    .storage()
+    .bucket()
+    .deleteFiles({
+      prefix: `${session.uid}/clips/videos/${doc.data().fileName}/`,
+    });
+  return docRef;
+}
+
+async function finalize(session) {
+  const folder = session.mimetype.startsWith("image/") ? "images" : "videos";
+  const bucket = admin.storage().bucket();
+  const fileRef = bucket.file(
+    `${session.uid}/clips/${folder}/${session.fileName}`
+  );
+  await pipeline(
+    fs.createReadStream(dataPath(session.id)),
+    fileRef.createWriteStream({ contentType: session.mimetype })
+  );
+
+  const docRef =
+    (folder === "videos" && (await replaceProgressive(session))) ||
+    (await saveFileMetadata(session.uid, session.mimetype, {
+      deviceID: session.deviceID,
+      fileName: session.fileName,
+      deviceLocation: session.deviceLocation,
+      timeSent: new Date(session.timeSent),
+      eventID: session.eventID,
+    }));
+
+  // Keep the session, marked complete, so a device whose response got lost
+  // learns the upload is done instead of sending the clip again
+  session.complete = true;
+  session.docId = docRef.id;
+  await saveSession(session);
+  await fs.promises.rm(dataPath(session.id), { force: true });
+}
+
+// Finish a fully received upload; a failed finalize is retried by the next
+// GET or PUT for the session
+async function finishIfReceived(session) {
+  if (session.complete || session.offset < session.size) {
+    return;
+  }
+  busy.add(session.id);
+  try {
+    await finalize(session);
+  } finally {
+    busy.delete(session.id);
+  }
+}
+
+const uploadState = (session) => ({
+  uploadId: session.id,
+  offset: session.offset,
+  size: session.size,
+  complete: Boolean(session.complete),
+  id: session.docId,
+});
+
+// Start an upload: { fileName, size, mimetype } plus the usual device headers
+router.post("/", async (req, res) => {
+  const { fileName, size, mimetype } = req.body;
+  const {
+    deviceid: deviceID,
+    devicelocation: deviceLocation,
+    timesent: timeSent,
+    eventid: eventID,
+  } = req.headers;
+
+  if (!fileName || !Number.isInteger(size) || size <= 0 || !mimetype) {
+    return res.status(400).send("fileName, size and mimetype are required.");
+  }
+  if (!mimetype.startsWith("image/") && !mimetype.startsWith("video/")) {
+    return res.status(400).send("Unsupported file type");
+  }
+
+  const session = {
+    id: crypto.randomBytes(16).toString("hex"),
+    uid: req.user.uid,
+    fileName: path.basename(fileName),
+    size,
+    mimetype,
+    offset: 0,
+    complete: false,
+    deviceID,
+    deviceLocation,
+    timeSent,
+    eventID,
+  };
+
+  try {
+    await fs.promises.writeFile(dataPath(session.id), "");
+    await saveSession(session);
+    res.status(201).json({ uploadId: session.id, offset: 0 });
+  } catch (error) {
+    res.status(500).send("Error creating upload: " + error.message);
+  }
+});
+
+// Ask how many bytes the server already has, to resume after a dropped connection
+router.get("/:id", async (req, res) => {
+  const session = await loadSession(req.params.id, req.user.uid);
+  if (!session) {
+    return res.status(404).send("Upload not found.");
+  }
+  if (busy.has(session.id)) {
+    return res.json(uploadState(session));
+  }
+  try {
+    await finishIfReceived(session);
+    res.json(uploadState(session));
+  } catch (error) {
+    res.status(500).send("Error saving upload: " + error.message);
+  }
+});
+
+// Append one chunk; the upload-offset header must match the stored offset
+router.put("/:id", async (req, res) => {
+  const session = await loadSession(req.params.id, req.user.uid);
+  if (!session) {
+    return res.status(404).send("Upload not found.");
+  }
+  if (session.complete) {
+    return res.json(uploadState(session));
+  }
+  if (busy.has(session.id)) {
+    return res.status(409).json({ offset: session.offset });
+  }
+
+  const offset = Number(req.headers["upload-offset"]);
+  if (offset !== session.offset) {
+    return res.status(409).json({ offset: session.offset });
+  }
+  const remaining = session.size - offset;
+  if (Number(req.headers["content-length"] ?? 0) > remaining) {
+    return res.status(413).json({ offset: session.offset });
+  }
+
+  busy.add(session.id);
+  const output = fs.createWriteStream(dataPath(session.id), {
+    flags: "r+",
+    start: offset,
+  });
+  let overrun = false;
+  try {
+    await pipeline(req, limitBytes(remaining), output);
+  } catch (error) {
+    // Connection dropped mid-chunk, keep whatever reached the disk. Only
+    // bytes within the declared size are ever written.
+    overrun = error.message === "Chunk overruns the upload size";
+  } finally {
+    busy.delete(session.id);
+  }
+
+  session.offset = offset + output.bytesWritten;
+  try {
+    await saveSession(session);
+    if (overrun) {
+      return res.status(413).json({ offset: session.offset });
+    }
+    // An empty chunk at offset === size retries a finalize that failed before
+    await finishIfReceived(session);
+    res.json(uploadState(session));
+  } catch (error) {
+    if (!res.headersSent) {
+      res.status(500).send("Error saving upload: " + error.message);
+    }
+  }
+});
+
+module.exports = router;
@@ -0,0 +1,84 @@
+// routes/segmentUploadRoute.js
+// Progressive clips: the device uploads a fragmented MP4 piece by piece while
+// the event is still recording. Pieces are stored as numbered parts under the
+// event's folder and served back concatenated by serveVideos.
+const express = require("express");
+const { admin, db } = require("../config/firebase");
+
+const router = express.Router();
+
+const MAX_SEGMENT_SIZE = "50mb";
+
+const partName = (index) => `part_${String(index).padStart(5, "0")}.m4s`;
+
+// Store one piece: PUT /:eventID/:index, upload-final: 1 on the last piece
+router.put(
+  "/:eventID/:index",
+  express.raw({ type: "*/*", limit: MAX_SEGMENT_SIZE }),
+  async (req, res) => {
+    const { eventID } = req.params;
+    const index = Number(req.params.index);
+    const {
+      deviceid: deviceID,
+      devicelocation: deviceLocation,
+      timesent: timeSent,
+    } = req.headers;
+    const final = req.headers["upload-final"] === "1";
+    const uid = req.user.uid;
+
+    if (
+      !/^[A-Za-z0-9_]+$/.test(eventID) ||
+      !Number.isInteger(index) ||
+      index < 0
+    ) {
+      return res.status(400).send("Invalid event ID or segment index.");
+    }
+    // The final request may be empty when every byte was already sent
+    const body = Buffer.isBuffer(req.body) ? req.body : Buffer.alloc(0);
+    if (body.length === 0 && !final) {
+      return res.status(400).send("Segment body is required.");
+    }
+
+    try {
+      if (body.length > 0) {
+        const bucket = admin.storage().bucket();
+        // Retries overwrite the same part, so a repeated upload is harmless
+        await bucket
+          .file(`${uid}/clips/videos/${eventID}/${partName(index)}`)
+          .save(body, { contentType: "video/mp4", resumable: false });
+      }
+
+      // One document per event, keyed by the event ID so retries merge into it
+      const docRef = db
+        .collection("users")
+        .doc(uid)
+        .collection("videos")
+        .doc(eventID);
+      const data = { progressive: true };
+      if (body.length > 0) {
+        data.segments = index + 1;
+      }
+      if (index === 0) {
+        Object.assign(data, {
+          deviceID,
+          fileName: eventID,
+          deviceLocation,
+          timeSent: new Date(timeSent),
+          eventID,
+          complete: false,
+        });
+      }
+      if (final) {
+        data.complete = true;
+      }
+      await docRef.set(data, { merge: true });
+
+      res.status(200).json({ index, complete: final });
+    } catch (error) {
+      res.status(500).send("Error saving segment: " + error.message);
+    }
+  }
+);
+
+module.exports = router;
+module.exports.partName = partName;
@@ -1,4 +1,5 @@
-const { admin, db, storage } = require("../config/firebase");
+const { admin } = require("../config/firebase");
+const saveFileMetadata = require("../utils/saveFileMetadata");
 
 module.exports = async (req, res) => {
   const {
@@ -60,20 +61,7 @@ module.exports = async (req, res) => {
       eventID: eventID,
     };
 
-    let docRef;
-    if (isImage) {
-      const userImagesRef = db
-        .collection("users")
-        .doc(uid)
-        .collection("images");
-      docRef = await userImagesRef.add(data);
-    } else if (isVideo) {
-      const userVideosRef = db
-        .collection("users")
-        .doc(uid)
-        .collection("videos");
-      docRef = await userVideosRef.add(data);
-    }
+    const docRef = await saveFileMetadata(uid, req.file.mimetype, data);
 
     res.status(200).send(`File metadata saved with ID: ${docRef.id}`);
   } catch (error) {
@@ -65,6 +65,8 @@ const verifyToken = require("./utils/verifyToken");
 // Load routes
 const verifyTokenRoute = require("./routes/verifyTokenRoute");
 const uploadRoute = require("./routes/uploadRoute");
+const chunkedUploadRoute = require("./routes/chunkedUploadRoute");
+const segmentUploadRoute = require("./routes/segmentUploadRoute");
 const videosRoute = require("./routes/videosRoute");
 const serveVideos = require("./utils/serveVideos");
 const serveImages = require("./utils/serveImages");
@@ -83,6 +85,12 @@ const upload = multer({ storage: require("./utils/fileStorage") });
 // File upload route
 app.post("/upload", verifyToken, upload.single("file"), uploadRoute);
 
+// Chunked, resumable upload routes for large clips
+app.use("/upload/sessions", verifyToken, chunkedUploadRoute);
+
+// Progressive clip segments, uploaded while the event is still recording
+app.use("/upload/segments", verifyToken, segmentUploadRoute);
+
 // Video retrieval route
 app.use("/videos", verifyToken, videosRoute);
 
@@ -136,6 +144,27 @@ app.post("/api/remove-faces", verifyToken, (req, res) => {
   );
 });
 
+// Mixed add/remove operations applied to the gallery in a single update
+app.post("/api/update-faces", verifyToken, (req, res) => {
+  const operations = req.body.operations;
+  const token = req.headers.authorization.split(" ")[1];
+  const user_uid = req.user.uid;
+
+  handleFaceOperation(
+    "update",
+    operations,
+    token,
+    process.env.STORAGE_BUCKET,
+    user_uid,
+    (err, result) => {
+      if (err) {
+        return res.status(500).send(err);
+      }
+      res.json(result);
+    }
+  );
+});
+
 // Serve React App - handle any other requests to index.html
 if (process.env.NODE_ENV === "production") {
   console.log("Production mode");
@@ -0,0 +1,82 @@
+// utils/benchFaceWorkers.js
+// Compares add-face latency and throughput of the worker pool against one
+// encode.py process per request. Run from the server directory:
+//
+//   node utils/benchFaceWorkers.js faces.json TOKEN uid1,uid2 [requests] [concurrency]
+//
+// faces.json holds the request body faces, e.g. [{"name": "a.jpg", "imageUrl": "..."}].
+// Requests are spread over the given users; each user's requests run in order.
+const fs = require("fs");
+const path = require("path");
+require("dotenv").config({ path: path.join(__dirname, "../.env") });
+const { spawnFaceOperation, FaceWorkerPool } = require("./faceHandler");
+
+const [facesFile, token, uidList, requestArg, concurrencyArg] =
+  process.argv.slice(2);
+if (!facesFile || !token || !uidList) {
+  console.error(
+    "usage: node utils/benchFaceWorkers.js faces.json TOKEN uid1,uid2 [requests] [concurrency]"
+  );
+  process.exit(1);
+}
+const faces = JSON.parse(fs.readFileSync(facesFile));
+const uids = uidList.split(",");
+const requests = Number(requestArg || 20);
+const concurrency = Number(concurrencyArg || 4);
+
+function percentile(sorted, fraction) {
+  const index = Math.floor(sorted.length * fraction);
+  return sorted[Math.min(sorted.length - 1, index)];
+}
+
+async function run(label, operation) {
+  const latencies = [];
+  let failures = 0;
+  let next = 0;
+  const start = Date.now();
+
+  const client = async () => {
+    while (next < requests) {
+      const index = next++;
+      const request = {
+        faces,
+        token,
+        storageBucket: process.env.STORAGE_BUCKET,
+        user_uid: uids[index % uids.length],
+        action: "add",
+      };
+      const requestStart = Date.now();
+      await new Promise((resolve) =>
+        operation("add", request, (err) => {
+          if (err) {
+            failures++;
+          }
+          resolve();
+        })
+      );
+      latencies.push(Date.now() - requestStart);
+    }
+  };
+  await Promise.all(Array.from({ length: concurrency }, client));
+
+  const seconds = (Date.now() - start) / 1000;
+  latencies.sort((a, b) => a - b);
+  console.log(
+    `${label}: ${requests} requests in ${seconds.toFixed(1)}s ` +
+      `(${(requests / seconds).toFixed(2)} req/s), ` +
+      `p50 ${percentile(latencies, 0.5)} ms, p95 ${percentile(latencies, 0.95)} ms, ` +
+      `${failures} failed`
+  );
+}
+
+(async () => {
+  await run("spawn per request", spawnFaceOperation);
+
+  const pool = new FaceWorkerPool(concurrency);
+  // Let the workers load their models first, like a server that has been up
+  await new Promise((resolve) => setTimeout(resolve, 5000));
+  await run(`pool of ${concurrency}`, (action, request, callback) =>
+    pool.submit(action, request, callback)
+  );
+  process.exit(0);
+})();
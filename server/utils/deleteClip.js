@@ -19,8 +19,15 @@ module.exports = async (req, res) => {
       const videoData = videoDoc.data();
       const videoFileName = videoData.fileName;
 
-      const videoFile = bucket.file(`${uid}/clips/videos/${videoFileName}`);
-      await videoFile.delete();
+      if (videoData.progressive) {
+        // Progressive clips are stored as numbered parts in their own folder
+        await bucket.deleteFiles({
+          prefix: `${uid}/clips/videos/${videoFileName}/`,
+        });
+      } else {
+        const videoFile = bucket.file(`${uid}/clips/videos/${videoFileName}`);
+        await videoFile.delete();
+      }
       await videoDoc.ref.delete();
     }
 
@@ -1,14 +1,20 @@
 import sys
 import json
-import face_recognition
 import numpy as np
 import requests
 from io import BytesIO
-from PIL import Image
+from galleryFormat import decode_gallery, encode_gallery, gallery_to_samples, samples_to_rows
+from enrollmentImage import DUPLICATE_THRESHOLD, encode_enrollment_face, find_duplicates, load_enrollment_image
 import pickle
-from firebase_admin import credentials, storage
+from firebase_admin import credentials, firestore, storage
 import firebase_admin
 import os
+import multiprocessing
+import random
+import time
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 # Initialize Firebase Admin SDK
 try:
@@ -19,121 +25,377 @@ except Exception as e:
     sys.exit(1)
 
 def load_encodings(user_uid):
-    """Load encodings from the existing .dat file in Firebase Storage."""
+    """Load {name: [encoding, ...]} and the generation of the .dat file it came from.
+
+    Generation 0 means the file does not exist yet.
+    """
     bucket = storage.bucket()
-    blob = bucket.blob(f'{user_uid}/encodings.dat')
+    blob = bucket.get_blob(f'{user_uid}/encodings.dat')
+    if blob is None:
+        return {}, 0
+    # Pin the generation so the bytes match the generation the update is checked against
+    data = blob.download_as_bytes(if_generation_match=blob.generation)
     try:
-        encodings_data = blob.download_as_text()
-        encodings = json.loads(encodings_data)
-        return encodings
-    except Exception as e:
+        # Binary gallery, or the JSON format older versions wrote
+        gallery = decode_gallery(data)
+        return gallery_to_samples(gallery), blob.generation
+    except ValueError as e:
         print(f"Error loading encodings: {e}", file=sys.stderr)
         sys.stderr.flush()
-        return {}
-        
-def save_encodings(user_uid, encodings):
-    """Save encodings to the .dat file in Firebase Storage."""
+        return {}, blob.generation
+
+def save_encodings(user_uid, encodings, generation):
+    """Save {name: [encoding, ...]} if the .dat file is still at generation.
+
+    Raises PreconditionFailed when another request wrote it in between.
+    Returns the new generation.
+    """
     bucket = storage.bucket()
     blob = bucket.blob(f'{user_uid}/encodings.dat')
+    encodings_data = encode_gallery(*samples_to_rows(encodings))
+    blob.upload_from_string(
+        encodings_data,
+        content_type='application/octet-stream',
+        if_generation_match=generation
+    )
+    return blob.generation
+
+def signal_encodings_update(user_uid, generation):
+    """Tell listening devices that a new gallery generation is in Storage."""
     try:
-        encodings_data = json.dumps(encodings)
-        blob.upload_from_string(encodings_data)
+        firestore.client().collection('users').document(user_uid).set(
+            {'encodingsGeneration': generation}, merge=True
+        )
     except Exception as e:
-        print(f"Error saving encodings: {e}", file=sys.stderr)
+        # Devices still pick the change up on their next periodic check
+        print(f"Error signaling encodings update: {e}", file=sys.stderr)
         sys.stderr.flush()
 
+MUTATION_ATTEMPTS = 5  # read-modify-write attempts when another request wrote first
+DOWNLOAD_WORKERS = 8  # concurrent image downloads
+# Encoding processes per encode.py process, each loads its own copy of the models
+ENCODE_PROCESSES = int(os.getenv('ENCODE_PROCESSES', min(4, os.cpu_count() or 1)))
+# Distance below which a new face counts as an already enrolled person
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', DUPLICATE_THRESHOLD))
+
+# One pooled keep-alive session shared by the download threads
+session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS)
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
+encode_pool = None
+
 def download_image(url, token):
-    """Download image from URL using Firebase Storage token and return as PIL Image."""
+    """Download image bytes from URL using Firebase Storage token."""
     headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
+    try:
+        response = session.get(url, headers=headers, timeout=60)
+    except requests.RequestException as e:
+        print(f"Error downloading image from {url}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        return None
     if response.status_code == 200:
-        return Image.open(BytesIO(response.content))
+        return response.content
     else:
         print(f"Error downloading image from {url}", file=sys.stderr)
         sys.stderr.flush()
         return None
 
-def add_face(known_faces, token, user_uid):
-    """Add a new face to the known faces."""
-    encodings = load_encodings(user_uid)
-    added_faces = []
-    errors = []
+def encode_image(data):
+    """Decode image bytes and return the main face's encoding as a list, or None."""
+    # Reduced-resolution decode, detection on a small copy, descriptor on a crop
+    image = load_enrollment_image(BytesIO(data))
+    print(f"Image size: {image.size}", file=sys.stderr)
+    sys.stderr.flush()
+
+    encoding = encode_enrollment_face(image)
+    if encoding is None:
+        print("Found no face in the image", file=sys.stderr)
+        sys.stderr.flush()
+        return None
+    return encoding.tolist()
+
+def get_encode_pool():
+    """Process pool for encoding, created once and reused by worker mode.
+
+    Processes are spawned, not forked: by the time they start, download
+    threads and the Firestore gRPC client may hold locks a fork would copy.
+    """
+    global encode_pool
+    if encode_pool is None:
+        encode_pool = ProcessPoolExecutor(
+            max_workers=ENCODE_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return encode_pool
+
+def encode_images(known_faces, token):
+    """Download all images concurrently and encode them in parallel.
+
+    Returns {name: encoding or None}; None marks a failed download, an
+    undecodable image or an image without a face.
+    """
+    results = {}
+    if not known_faces:
+        return results
+    # A single photo is faster in-process than starting the pool
+    pool = get_encode_pool() if len(known_faces) > 1 and ENCODE_PROCESSES > 1 else None
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as downloads:
+        download_futures = {
+            downloads.submit(download_image, image_url, token): name
+            for name, image_url in known_faces.items()
+        }
+        encode_futures = {}
+        in_process = {}
+        # Start encoding each image as soon as its download finishes
+        for future in as_completed(download_futures):
+            name = download_futures[future]
+            data = future.result()
+            if data is None:
+                results[name] = None
+            elif pool is None:
+                in_process[name] = data
+            else:
+                encode_futures[name] = pool.submit(encode_image, data)
+
+    for name, data in in_process.items():
+        try:
+            results[name] = encode_image(data)
+        except Exception as e:
+            print(f"Error encoding {name}: {e}", file=sys.stderr)
+            sys.stderr.flush()
+            results[name] = None
+
+    for name, future in encode_futures.items():
+        try:
+            results[name] = future.result()
+        except BrokenProcessPool as e:
+            print(f"Error encoding {name}: {e}", file=sys.stderr)
+            sys.stderr.flush()
+            reset_encode_pool()
+            results[name] = None
+        except Exception as e:
+            print(f"Error encoding {name}: {e}", file=sys.stderr)
+            sys.stderr.flush()
+            results[name] = None
+    return results
+
+def reset_encode_pool():
+    """Drop a broken pool so the next request starts a fresh one."""
+    global encode_pool
+    if encode_pool is not None:
+        encode_pool.shutdown(wait=False)
+        encode_pool = None
+
+def wait_before_retry(attempt):
+    """Back off with jitter after another request updated encodings.dat first."""
+    print("Encodings changed during the update, retrying.", file=sys.stderr)
+    sys.stderr.flush()
+    time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+def target_identity(operation):
+    """Identity an add operation enrolls into, and whether it adds a sample.
+
+    With an "identity" field the photo becomes one more sample of that
+    person; otherwise the file name without extension names a new person.
+    """
+    identity = operation.get('identity')
+    if identity:
+        return identity, True
+    return os.path.splitext(operation['name'])[0], False
+
+def check_duplicates(encodings, operations, new_encodings):
+    """Return {name: duplicated identity or None} for the adds that may apply.
+
+    All new faces are checked in one vectorized query against the gallery
+    as it is after this batch's removals, and against each other.
+    """
+    present = set(encodings)
+    removed = set()
+    names, identities, candidates = [], [], []
+    for operation in operations:
+        name = operation['name']
+        if operation['op'] == 'remove':
+            base_name = os.path.splitext(name)[0]
+            present.discard(base_name)
+            removed.add(base_name)
+            continue
+        identity, is_sample = target_identity(operation)
+        if new_encodings.get(name) is not None and (is_sample or identity not in present):
+            present.add(identity)
+            names.append(name)
+            identities.append(identity)
+            candidates.append(new_encodings[name])
+    remaining = {
+        name: samples for name, samples in encodings.items() if name not in removed
+    }
+    duplicates = find_duplicates(remaining, identities, candidates, DUPLICATE_THRESHOLD)
+    return dict(zip(names, duplicates))
+
+def apply_face_operations(operations, token, user_uid):
+    """Apply add/remove operations to the gallery with one download and one upload.
+
+    Each operation is {"op": "add", "name": ..., "imageUrl": ...} or
+    {"op": "remove", "name": ...}, applied in list order. An add with an
+    "identity" field adds another sample to that person. Images are encoded
+    once up front; the read-modify-write of encodings.dat is then retried
+    with a fresh copy whenever another request updated it first.
+    """
+    for operation in operations:
+        if operation.get('op') not in ('add', 'remove'):
+            raise ValueError(f"Unknown face operation: {operation.get('op')}")
+    known_faces = {
+        operation['name']: operation['imageUrl']
+        for operation in operations if operation['op'] == 'add'
+    }
     for name, image_url in known_faces.items():
         print(f"Processing {name} from {image_url}", file=sys.stderr)
-        sys.stderr.flush()
-        image = download_image(image_url, token)
-        if image is None:
-            errors.append(name)
+    sys.stderr.flush()
+    new_encodings = encode_images(known_faces, token)
+
+    for attempt in range(MUTATION_ATTEMPTS):
+        try:
+            encodings, generation = load_encodings(user_uid)
+        except (PreconditionFailed, NotFound):
+            # Replaced or deleted between reading its generation and downloading it
+            wait_before_retry(attempt)
             continue
+        checks = check_duplicates(encodings, operations, new_encodings)
+        added_faces = []
+        removed_faces = []
+        duplicates = {}
+        errors = []
+        changed = False
+        for operation in operations:
+            name = operation['name']
+            base_name = os.path.splitext(name)[0]  # Extract name without extension
+            if operation['op'] == 'remove':
+                removed_faces.append(name)
+                if base_name in encodings:
+                    del encodings[base_name]
+                    changed = True
+                    print(f"Encoding for {base_name} removed successfully.", file=sys.stderr)
+                else:
+                    print(f"Face {base_name} not found. Skipping.", file=sys.stderr)
+                continue
 
-        image_np = np.array(image)
-        print(f"Image shape: {image_np.shape}", file=sys.stderr)
-        sys.stderr.flush()
-        
-        face_encodings = face_recognition.face_encodings(image_np)
-        print(f"Found {len(face_encodings)} face(s) in the image", file=sys.stderr)
+            encoding = new_encodings.get(name)
+            if encoding is None:
+                print(f"No faces found in {operation['imageUrl']}. Skipping.", file=sys.stderr)
+                errors.append(name)
+                continue
+            identity, is_sample = target_identity(operation)
+            if (identity in encodings and not is_sample) or name not in checks:
+                print(f"Face {identity} already exists. Skipping.", file=sys.stderr)
+                continue
+            if checks[name] is not None:
+                # Keep the gallery compact: one identity per person, no repeated samples
+                duplicates[name if is_sample else identity] = checks[name]
+                print(f"Face {name} looks like {checks[name]}. Skipping.", file=sys.stderr)
+                continue
+            encodings.setdefault(identity, []).append(encoding)
+            added_faces.append(identity)
+            changed = True
+            print(f"Encoding for {identity} added successfully.", file=sys.stderr)
         sys.stderr.flush()
 
-        if len(face_encodings) > 0:
-            encoding = face_encodings[0].tolist()
-            base_name = os.path.splitext(name)[0]  # Extract name without extension
-            if base_name in encodings or any(
-                np.array_equal(encoding, existing_encoding)
-                for existing_encoding in encodings.values()
-            ):
-                print(f"Face {base_name} already exists. Skipping.", file=sys.stderr)
-                sys.stderr.flush()
+        if changed:
+            try:
+                generation = save_encodings(user_uid, encodings, generation)
+            except PreconditionFailed:
+                wait_before_retry(attempt)
                 continue
-            encodings[base_name] = encoding
-            added_faces.append(base_name)
-            print(f"Encoding for {base_name} added successfully.", file=sys.stderr)
-            sys.stderr.flush()
-        else:
-            print(f"No faces found in {image_url}. Skipping.", file=sys.stderr)
-            sys.stderr.flush()
-            errors.append(name)
-    save_encodings(user_uid, encodings)
-    return encodings, added_faces, errors
-
-def remove_face(face_name, user_uid):
-    """Remove a face from the known faces."""
-    encodings = load_encodings(user_uid)
-    base_name = os.path.splitext(face_name)[0]  # Extract name without extension
-    if base_name in encodings:
-        del encodings[base_name]
-        print(f"Encoding for {base_name} removed successfully.", file=sys.stderr)
-    else:
-        print(f"Face {base_name} not found. Skipping.", file=sys.stderr)
-    save_encodings(user_uid, encodings)
+            signal_encodings_update(user_uid, generation)
 
-if __name__ == "__main__":
-    try:
-        args = json.loads(sys.argv[1])
-        action = args.get('action')
-        faces = args['faces']
-        token = args['token']
-        storageBucket = args['storageBucket']
-        user_uid = args['user_uid']
+        # The response keeps its {name: encoding} shape, one sample per identity
+        first_samples = {
+            name: np.asarray(samples[0]).tolist() for name, samples in encodings.items()
+        }
+        return {
+            "encodings": first_samples,
+            "added_faces": added_faces,
+            "removed_faces": removed_faces,
+            "duplicates": duplicates,
+            "errors": errors
+        }
+    raise RuntimeError(f"Encodings kept changing, gave up after {MUTATION_ATTEMPTS} attempts")
+
+def initialize_firebase(storage_bucket):
+    """Initialize Firebase Admin once per process."""
+    if not firebase_admin._apps:
         firebase_admin.initialize_app(cred, {
-          'storageBucket': storageBucket
+          'storageBucket': storage_bucket
         })
-        if action == 'add':
-            known_faces = {face['name']: face['imageUrl'] for face in faces}
-            encodings, added_faces, errors = add_face(known_faces, token, user_uid)
-            result = {
-                "encodings": encodings,
-                "added_faces": added_faces,
-                "errors": errors
-            }
-        elif action == 'remove':
-            removed_faces = []
-            for face in faces:
-                remove_face(face['name'], user_uid)
-                removed_faces.append(face['name'])
-            result = {
-                "removed_faces": removed_faces
+
+def handle_request(args):
+    """Run one add, remove or update request and return its JSON-serializable result."""
+    action = args.get('action')
+    faces = args['faces']
+    token = args['token']
+    user_uid = args['user_uid']
+    initialize_firebase(args['storageBucket'])
+    if action == 'add':
+        operations = [
+            {
+                'op': 'add',
+                'name': face['name'],
+                'imageUrl': face['imageUrl'],
+                'identity': face.get('identity')
             }
-            
+            for face in faces
+        ]
+        result = apply_face_operations(operations, token, user_uid)
+        return {
+            "encodings": result["encodings"],
+            "added_faces": result["added_faces"],
+            "duplicates": result["duplicates"],
+            "errors": result["errors"]
+        }
+    elif action == 'remove':
+        operations = [{'op': 'remove', 'name': face['name']} for face in faces]
+        result = apply_face_operations(operations, token, user_uid)
+        return {
+            "removed_faces": result["removed_faces"]
+        }
+    elif action == 'update':
+        # faces is a mixed list of operations, see apply_face_operations
+        return apply_face_operations(faces, token, user_uid)
+    raise ValueError(f"Unknown action: {action}")
+
+def run_worker():
+    """Serve requests as JSON lines on stdin/stdout with the models kept loaded.
+
+    Each request line is {"id": ..., ...request} and gets exactly one response
+    line {"id": ..., "result": ...} or {"id": ..., "error": ...}. Logs go to
+    stderr so stdout only carries responses.
+    """
+    if ENCODE_PROCESSES > 1:
+        get_encode_pool()  # before any request starts threads
+    print("Face encoding worker ready", file=sys.stderr)
+    sys.stderr.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            response = {"id": request_id, "result": handle_request(request)}
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.stderr.flush()
+            response = {"id": request_id, "error": str(e)}
+        print(json.dumps(response))
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        run_worker()
+        sys.exit(0)
+    try:
+        result = handle_request(json.loads(sys.argv[1]))
         print(json.dumps(result))
         sys.stdout.flush()
     except Exception as e:
@@ -1,27 +1,169 @@
 // utils/faceHandler.js
+// Face add/remove requests run in a fixed pool of long-lived encode.py
+// workers (encode.py --worker) that keep dlib and Firebase Admin loaded and
+// talk JSON lines over stdin/stdout. FACE_WORKERS=0 spawns one process per
+// request instead, as before.
 const { spawn } = require("child_process");
+const readline = require("readline");
 
-function handleFaceOperation(
-  action,
-  faces,
-  token,
-  storageBucket,
-  user_uid,
-  callback
-) {
-  const pythonProcess = spawn("python", [
-    "./utils/encode.py",
-    JSON.stringify({
-      faces,
-      token,
-      storageBucket,
-      user_uid,
-      action,
-    }),
-  ]);
+const FACE_WORKERS = Number(process.env.FACE_WORKERS ?? 2);
+const PYTHON = process.env.PYTHON || "python";
+const ENCODE_SCRIPT = "./utils/encode.py";
+const RESTART_DELAY = 1000; // ms before replacing a worker that exited
+// ms a request may take before its worker is killed and replaced
+const FACE_JOB_TIMEOUT = Number(process.env.FACE_JOB_TIMEOUT ?? 300000);
+
+class FaceWorker {
+  constructor(pool) {
+    this.pool = pool;
+    this.job = null;
+    this.timedOutJob = null;
+    this.timer = null;
+    this.log = "";
+    this.process = spawn(PYTHON, [ENCODE_SCRIPT, "--worker"]);
+
+    readline
+      .createInterface({ input: this.process.stdout })
+      .on("line", (line) => this.onResponse(line));
+
+    this.process.stderr.on("data", (chunk) => {
+      // Keep the tail of the log for error messages, like the spawn mode does
+      this.log = (this.log + chunk).slice(-4096);
+    });
+
+    // A worker that died mid-write is handled by the close event below
+    this.process.stdin.on("error", () => {});
+
+    this.process.on("error", (error) => {
+      console.error("Face worker error:", error.message);
+    });
+
+    this.process.on("close", (code) => {
+      clearTimeout(this.timer);
+      const job = this.job;
+      this.job = null;
+      if (job) {
+        job.callback(`Error during face ${job.action}: ${this.log}`, null);
+      }
+      console.error(`Face worker exited with code ${code}, restarting`);
+      // A timed-out job's user is only released once its worker is gone, so
+      // it can no longer write encodings.dat behind the next request
+      this.pool.replace(this, job || this.timedOutJob);
+    });
+  }
+
+  run(job) {
+    this.job = job;
+    this.log = "";
+    this.timer = setTimeout(() => this.onTimeout(), FACE_JOB_TIMEOUT);
+    this.process.stdin.write(
+      JSON.stringify({ id: job.id, ...job.request }) + "\n"
+    );
+  }
+
+  onTimeout() {
+    const job = this.job;
+    if (!job) {
+      return;
+    }
+    this.job = null;
+    this.timedOutJob = job;
+    job.callback(
+      `Error during face ${job.action}: timed out after ${FACE_JOB_TIMEOUT} ms`,
+      null
+    );
+    this.process.kill("SIGKILL");
+  }
+
+  onResponse(line) {
+    const job = this.job;
+    if (!job) {
+      return;
+    }
+    let response;
+    try {
+      response = JSON.parse(line);
+    } catch (parseError) {
+      response = {
+        id: job.id,
+        error: `Error parsing JSON output: ${parseError}`,
+      };
+    }
+    if (response.id !== job.id) {
+      return;
+    }
+
+    this.job = null;
+    clearTimeout(this.timer);
+    if (response.error) {
+      job.callback(`Error during face ${job.action}: ${response.error}`, null);
+    } else {
+      job.callback(null, response.result);
+    }
+    this.pool.release(this, job);
+  }
+}
+
+class FaceWorkerPool {
+  constructor(size) {
+    this.idle = [];
+    this.queue = [];
+    // Users with a request in flight. Their requests run one at a time so
+    // concurrent read-modify-write of encodings.dat cannot lose an update.
+    this.activeUsers = new Set();
+    this.nextId = 1;
+    for (let i = 0; i < size; i++) {
+      this.idle.push(new FaceWorker(this));
+    }
+  }
+
+  submit(action, request, callback) {
+    this.queue.push({ id: this.nextId++, action, request, callback });
+    this.dispatch();
+  }
+
+  dispatch() {
+    while (this.idle.length > 0) {
+      const index = this.queue.findIndex(
+        (job) => !this.activeUsers.has(job.request.user_uid)
+      );
+      if (index === -1) {
+        return;
+      }
+      const [job] = this.queue.splice(index, 1);
+      this.activeUsers.add(job.request.user_uid);
+      this.idle.pop().run(job);
+    }
+  }
+
+  release(worker, job) {
+    this.activeUsers.delete(job.request.user_uid);
+    this.idle.push(worker);
+    this.dispatch();
+  }
+
+  replace(worker, job) {
+    this.idle = this.idle.filter((idleWorker) => idleWorker !== worker);
+    if (job) {
+      this.activeUsers.delete(job.request.user_uid);
+    }
+    setTimeout(() => {
+      this.idle.push(new FaceWorker(this));
+      this.dispatch();
+    }, RESTART_DELAY);
+  }
+}
+
+// One short-lived encode.py process per request
+function spawnFaceOperation(action, request, callback) {
+  const pythonProcess = spawn(PYTHON, [ENCODE_SCRIPT, JSON.stringify(request)]);
 
   let data = "";
   let error = "";
+  const timer = setTimeout(() => {
+    error += `timed out after ${FACE_JOB_TIMEOUT} ms`;
+    pythonProcess.kill("SIGKILL");
+  }, FACE_JOB_TIMEOUT);
 
   pythonProcess.stdout.on("data", (chunk) => {
     data += chunk;
@@ -32,6 +174,7 @@ function handleFaceOperation(
   });
 
   pythonProcess.on("close", (code) => {
+    clearTimeout(timer);
     if (code !== 0) {
       callback(`Error during face ${action}: ${error}`, null);
     } else {
@@ -45,4 +188,27 @@ function handleFaceOperation(
   });
 }
 
+let pool = null;
+
+function handleFaceOperation(
+  action,
+  faces,
+  token,
+  storageBucket,
+  user_uid,
+  callback
+) {
+  const request = { faces, token, storageBucket, user_uid, action };
+  if (FACE_WORKERS <= 0) {
+    return spawnFaceOperation(action, request, callback);
+  }
+  // Started on first use so tools that only require this module stay light
+  if (!pool) {
+    pool = new FaceWorkerPool(FACE_WORKERS);
+  }
+  pool.submit(action, request, callback);
+}
+
 module.exports = handleFaceOperation;
+module.exports.spawnFaceOperation = spawnFaceOperation;
+module.exports.FaceWorkerPool = FaceWorkerPool;
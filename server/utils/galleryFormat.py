@@ -0,0 +1,196 @@
+"""Binary encodings.dat format shared by the device and the server.
+
+Layout (little-endian):
+
+    offset  size  field
+    0       4     magic b"GEFG"
+    4       2     format version
+    6       2     header size (64, the matrix starts right after it)
+    8       4     dimension of each descriptor (128)
+    12      4     number of rows
+    16      8     offset of the name table
+    24      8     size of the name table in bytes
+    32      32    SHA-256 of the matrix bytes followed by the name table
+    64      ...   float32 matrix, rows x dimension, memory-mappable
+    ...     ...   name table, a UTF-8 JSON list with one name per row
+
+Files written before this format are still read: a JSON {name: [floats]}
+object from the server, and, for trusted local files only, the pickled dict
+device/scripts/encode.py used to write.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"GEFG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIQQ32s")
+HEADER_SIZE = 64
+DIMENSION = 128
+
+# names is a list with one entry per matrix row
+Gallery = namedtuple("Gallery", ["names", "matrix", "content_hash"])
+
+
+class GalleryFormatError(ValueError):
+    pass
+
+
+def _content_hash(matrix_bytes, names_bytes):
+    digest = hashlib.sha256()
+    digest.update(matrix_bytes)
+    digest.update(names_bytes)
+    return digest.digest()
+
+
+def encode_gallery(names, matrix):
+    """Serialize names and a (rows x DIMENSION) matrix to bytes."""
+    matrix = np.ascontiguousarray(matrix, dtype="<f4").reshape(-1, DIMENSION)
+    if len(names) != len(matrix):
+        raise GalleryFormatError("one name is needed per matrix row")
+    matrix_bytes = matrix.tobytes()
+    names_bytes = json.dumps(list(names), ensure_ascii=False).encode("utf-8")
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        HEADER_SIZE,
+        DIMENSION,
+        len(matrix),
+        HEADER_SIZE + len(matrix_bytes),
+        len(names_bytes),
+        _content_hash(matrix_bytes, names_bytes),
+    )
+    return header.ljust(HEADER_SIZE, b"\0") + matrix_bytes + names_bytes
+
+
+def _parse_header(data):
+    if len(data) < HEADER_SIZE:
+        raise GalleryFormatError("file is too short for a gallery header")
+    (
+        magic,
+        version,
+        header_size,
+        dimension,
+        count,
+        names_offset,
+        names_size,
+        content_hash,
+    ) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise GalleryFormatError("not a binary gallery file")
+    if version > VERSION:
+        raise GalleryFormatError(f"unsupported gallery version {version}")
+    return header_size, dimension, count, names_offset, names_size, content_hash
+
+
+def decode_gallery(data, verify=True, allow_pickle=False):
+    """Parse gallery bytes; old JSON (and pickle) files are converted on the fly."""
+    if not data.startswith(MAGIC):
+        return _decode_legacy(data, allow_pickle)
+
+    header_size, dimension, count, names_offset, names_size, content_hash = (
+        _parse_header(data)
+    )
+    matrix_bytes = data[header_size : header_size + count * dimension * 4]
+    names_bytes = data[names_offset : names_offset + names_size]
+    if verify and _content_hash(matrix_bytes, names_bytes) != content_hash:
+        raise GalleryFormatError("gallery content hash mismatch")
+    matrix = np.frombuffer(matrix_bytes, dtype="<f4").reshape(count, dimension)
+    names = json.loads(bytes(names_bytes).decode("utf-8"))
+    return Gallery(names, matrix, content_hash)
+
+
+def read_gallery(path, mmap=True, verify=False, allow_pickle=False):
+    """Read a gallery file, memory-mapping the matrix when possible.
+
+    A mapped matrix is read-only and only paged in as it is used, so loading
+    a large gallery does not copy it into memory.
+    """
+    with open(path, "rb") as file:
+        head = file.read(HEADER_SIZE)
+        if not head.startswith(MAGIC):
+            return _decode_legacy(head + file.read(), allow_pickle)
+        if not mmap or verify:
+            return decode_gallery(head + file.read(), verify=verify)
+        header_size, dimension, count, names_offset, names_size, content_hash = (
+            _parse_header(head)
+        )
+        file.seek(names_offset)
+        names = json.loads(file.read(names_size).decode("utf-8"))
+
+    if count == 0:
+        matrix = np.empty((0, dimension), dtype="<f4")
+    else:
+        matrix = np.memmap(
+            path, dtype="<f4", mode="r", offset=header_size, shape=(count, dimension)
+        )
+    return Gallery(names, matrix, content_hash)
+
+
+def write_gallery(path, names, matrix):
+    """Write a gallery file atomically (temporary file, then rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(encode_gallery(names, matrix))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def gallery_from_dict(encodings):
+    """Build a Gallery from a {name: encoding} dict."""
+    names = list(encodings.keys())
+    matrix = np.asarray(list(encodings.values()), dtype="<f4").reshape(-1, DIMENSION)
+    matrix_bytes = np.ascontiguousarray(matrix).tobytes()
+    names_bytes = json.dumps(names, ensure_ascii=False).encode("utf-8")
+    return Gallery(names, matrix, _content_hash(matrix_bytes, names_bytes))
+
+
+def gallery_to_dict(gallery):
+    """Return {name: list of floats}, the shape the JSON format used."""
+    return {
+        name: row.tolist()
+        for name, row in zip(gallery.names, np.asarray(gallery.matrix))
+    }
+
+
+def gallery_to_samples(gallery):
+    """Return {name: [encoding, ...]}, keeping every sample of an identity."""
+    samples = {}
+    for name, row in zip(gallery.names, np.asarray(gallery.matrix)):
+        samples.setdefault(name, []).append(row)
+    return samples
+
+
+def samples_to_rows(samples):
+    """Flatten {name: [encoding, ...]} into (names, rows) with one row per sample."""
+    names, rows = [], []
+    for name, encodings in samples.items():
+        for encoding in encodings:
+            names.append(name)
+            rows.append(encoding)
+    return names, rows
+
+
+def _decode_legacy(data, allow_pickle=False):
+    if not data.strip():
+        return gallery_from_dict({})
+    try:
+        encodings = json.loads(data)
+    except ValueError:
+        # Unpickling runs arbitrary code, never do it for downloaded files
+        if not allow_pickle:
+            raise GalleryFormatError("unrecognized encodings file") from None
+        try:
+            encodings = pickle.loads(data)
+        except Exception:
+            raise GalleryFormatError("unrecognized encodings file") from None
+    if not isinstance(encodings, dict):
+        raise GalleryFormatError("unrecognized encodings file")
+    return gallery_from_dict(encodings)
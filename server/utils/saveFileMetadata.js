@@ -0,0 +1,15 @@
+const { db } = require("../config/firebase");
+
+// Records an uploaded clip file in the user's images or videos collection
+module.exports = async (uid, mimetype, data) => {
+  let collection;
+  if (mimetype.startsWith("image/")) {
+    collection = "images";
+  } else if (mimetype.startsWith("video/")) {
+    collection = "videos";
+  } else {
+    return null;
+  }
+
+  return db.collection("users").doc(uid).collection(collection).add(data);
+};
@@ -1,4 +1,33 @@
+const { pipeline } = require("stream/promises");
 const { admin, db } = require("../config/firebase");
+const { partName } = require("../routes/segmentUploadRoute");
+
+// Streams the parts uploaded so far back to back; the result is a valid
+// fragmented MP4 that grows as the device uploads more of the event
+async function serveProgressive(bucket, uid, data, res) {
+  const [files] = await bucket.getFiles({
+    prefix: `${uid}/clips/videos/${data.fileName}/`,
+  });
+  const parts = new Map(
+    files.map((file) => [file.name.split("/").pop(), file])
+  );
+
+  // Only serve the contiguous prefix, a missing part would corrupt the stream
+  const ordered = [];
+  while (parts.has(partName(ordered.length))) {
+    ordered.push(parts.get(partName(ordered.length)));
+  }
+  if (ordered.length === 0) {
+    return res.status(404).send("Video file not found");
+  }
+
+  res.set("Content-Type", "video/mp4");
+  res.set("X-Clip-Complete", String(Boolean(data.complete)));
+  for (const file of ordered) {
+    await pipeline(file.createReadStream(), res, { end: false });
+  }
+  res.end();
+}
 
 module.exports = async (req, res) => {
   const uid = req.user.uid;
@@ -20,6 +49,11 @@ module.exports = async (req, res) => {
     const fileName = data.fileName;
 
     const bucket = admin.storage().bucket();
+
+    if (data.progressive) {
+      return await serveProgressive(bucket, uid, data, res);
+    }
+
     const file = bucket.file(`${uid}/clips/videos/${fileName}`);
 
     const [exists] = await file.exists();
@@ -35,6 +69,10 @@ module.exports = async (req, res) => {
 
     stream.pipe(res);
   } catch (error) {
+    if (res.headersSent) {
+      // Mid-stream, e.g. the viewer closed the player; just drop the response
+      return res.destroy();
+    }
     res.status(500).send("Server error: " + error.message);
   }
 };